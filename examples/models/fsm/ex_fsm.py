@@ -6,21 +6,21 @@ FSM Description: Example of a simple FSM
 
 Examples:
 
->>> from coord_dsl.fsm import fsm_step
+>>> from coord_dsl.fsm import StateHooks, fsm_dispatch, fsm_step
 >>> from coord_dsl.event_loop import reconfig_event_buffers
 >>> from fsm_example import create_fsm
->>> fsm = create_fsm()
+>>> fsm = create_fsm({StateID.S_XXXX: StateHooks(on_enter=..., on_step=...)})
 >>> while True:
 ...     if fsm.current_state_index == StateID.S_EXIT:
 ...         print("State machine completed successfully")
 ...         break
-...     fsm_behavior(fsm, ud) # user-defined behaviour with user data
+...     fsm_dispatch(fsm) # user-defined behaviour of the current state
 ...     fsm_step(fsm)
 ...     reconfig_event_buffers(fsm.event_data)
 """
 from enum import IntEnum, auto
 from coord_dsl.event_loop import EventData
-from coord_dsl.fsm import FSMData, Transition, EventReaction
+from coord_dsl.fsm import FSMData, Transition, EventReaction, StateHooks
 
 
 # Event IDs
@@ -71,8 +71,8 @@ class ReactionID(IntEnum):
     R_E_STEP3 = auto()
 
 
-def create_fsm() -> FSMData:
-    """Creates the FSM data structure."""
+def create_fsm(state_hooks: dict[StateID, StateHooks] | None = None) -> FSMData:
+    """Creates the FSM data structure, with optional behaviour hooks of the states."""
     # Transitions
     trans_dict = {
         TransitionID.T_START_CONFIGURE: Transition(StateID.S_START, StateID.S_CONFIGURE),
@@ -147,6 +147,11 @@ def create_fsm() -> FSMData:
     # Events
     events = EventData(len(EventID))
 
+    # State hooks
+    hooks_list = None
+    if state_hooks is not None:
+        hooks_list = [state_hooks.get(i) for i in StateID]
+
     # Return FSM Data
     return FSMData(
         event_data=events,
@@ -156,4 +161,5 @@ def create_fsm() -> FSMData:
         transitions=trans_list,
         event_reactions=evt_reaction_list,
         current_state_index=StateID.S_START,
+        state_hooks=hooks_list,
     )
\ No newline at end of file
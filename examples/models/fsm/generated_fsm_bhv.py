@@ -10,10 +10,10 @@ from dataclasses import dataclass
 import time
 from coord_dsl.event_loop import (
     produce_event,
-    consume_event,
     reconfig_event_buffers,
 )
-from coord_dsl.fsm import FSMData, fsm_step
+from coord_dsl.fsm import FSMData, StateHooks, fsm_dispatch, fsm_step
+from coord_dsl.monitor import StateMonitor
 from ex_fsm import EventID, StateID, create_fsm
 
 
@@ -53,11 +53,12 @@ def idle_on_end(fsm: FSMData, ud: UserData):
     ud.compile = not ud.compile
 
 
-def generic_step(fsm: FSMData, ud: UserData, start_event: EventID) -> bool:
-    """Return True if timeout has occurred, i.e., state finished."""
-    if consume_event(fsm.event_data, start_event):
-        print(f"Entered state '{StateID(fsm.current_state_index).name}'")
+def on_enter(fsm: FSMData):
+    print(f"Entered state '{StateID(fsm.current_state_index).name}'")
+
 
+def generic_step(fsm: FSMData, ud: UserData) -> bool:
+    """Return True if timeout has occurred, i.e., state finished."""
     ud.current_time = time.time()
     assert ud.transition_time is not None
     if ud.current_time < ud.transition_time:
@@ -69,58 +70,42 @@ def generic_step(fsm: FSMData, ud: UserData, start_event: EventID) -> bool:
     return True
 
 
-def fsm_behavior(fsm: FSMData, ud: UserData, bhv_data: dict):
-    cs = fsm.current_state_index
-    # print(f"Current state: '{StateID(fsm.current_state_index).name}'")
-    if cs not in bhv_data:
-        return
+def step_hooks(ud: UserData, on_end) -> StateHooks:
+    """Hooks of a state which calls `on_end` once its duration elapsed"""
 
-    bhv_data_cs = bhv_data[cs]
-    assert "step" in bhv_data_cs, f"no step defined for state: {cs}"
-    if not bhv_data_cs["step"](fsm, ud):
-        # not done
-        return
+    def on_step(fsm: FSMData):
+        if generic_step(fsm, ud):
+            on_end(fsm, ud)
 
-    if "on_end" in bhv_data_cs:
-        bhv_data_cs["on_end"](fsm, ud)
+    return StateHooks(on_enter=on_enter, on_step=on_step)
 
 
-def main(state_duration_sec: float):
+def main(state_duration_sec: float, monitor_path: str | None = None):
     signal.signal(signal.SIGINT, signal_handler)
 
     print("Starting generated FSM example. Press Ctrl+C to exit.")
-    fsm = create_fsm()
-    fsm_bhv = {
-        StateID.S_CONFIGURE: {
-            "step": lambda fsm, ud: generic_step(
-                fsm, ud, EventID.E_CONFIGURE_ENTERED
-            ),
-            "on_end": lambda fsm, ud: generic_on_end(
-                fsm, ud, [EventID.E_CONFIGURE_EXIT]
-            ),
-        },
-        StateID.S_IDLE: {
-            "step": lambda fsm, ud: generic_step(
-                fsm, ud, EventID.E_IDLE_ENTERED
+    now = time.time()
+    ud = UserData(current_time=now, state_duration=state_duration_sec)
+    fsm = create_fsm(
+        {
+            StateID.S_CONFIGURE: step_hooks(
+                ud, lambda fsm, ud: generic_on_end(fsm, ud, [EventID.E_CONFIGURE_EXIT])
             ),
-            "on_end": idle_on_end,
-        },
-        StateID.S_COMPILE: {
-            "step": lambda fsm, ud: generic_step(
-                fsm, ud, EventID.E_COMPILE_ENTERED
+            StateID.S_IDLE: step_hooks(ud, idle_on_end),
+            StateID.S_COMPILE: step_hooks(
+                ud, lambda fsm, ud: generic_on_end(fsm, ud, [EventID.E_COMPILE_EXIT])
             ),
-            "on_end": lambda fsm, ud: generic_on_end(fsm, ud, [EventID.E_COMPILE_EXIT]),
-        },
-        StateID.S_EXECUTE: {
-            "step": lambda fsm, ud: generic_step(
-                fsm, ud, EventID.E_EXECUTE_ENTERED
+            StateID.S_EXECUTE: step_hooks(
+                ud, lambda fsm, ud: generic_on_end(fsm, ud, [EventID.E_EXECUTE_EXIT])
             ),
-            "on_end": lambda fsm, ud: generic_on_end(fsm, ud, [EventID.E_EXECUTE_EXIT]),
-        },
-    }
+        }
+    )
+
+    # mirror the state for external monitors, e.g. `StateMonitor(monitor_path).read(0)`, replacing
+    # the file of a previous run
+    if monitor_path is not None:
+        StateMonitor(monitor_path, num_slots=1, overwrite=True).attach(fsm, 0)
 
-    now = time.time()
-    ud = UserData(current_time=now, state_duration=state_duration_sec)
     loop_timeout = now + LOOP_DURATION
     while True:
         if fsm.current_state_index == StateID.S_EXIT:
@@ -136,7 +121,7 @@ def main(state_duration_sec: float):
         produce_event(fsm.event_data, EventID.E_STEP)
 
         # FSM behaviour
-        fsm_behavior(fsm, ud, fsm_bhv)
+        fsm_dispatch(fsm)
 
         # State transitions
         reconfig_event_buffers(fsm.event_data)
@@ -157,5 +142,10 @@ if __name__ == "__main__":
         default=0.5,
         help="Duration in seconds to sleep in each state",
     )
+    parser.add_argument(
+        "--monitor",
+        "-m",
+        help="File to mirror the FSM state into for external monitors, e.g. /dev/shm/ex_fsm",
+    )
     args = parser.parse_args()
-    main(args.state_duration)
+    main(args.state_duration, args.monitor)
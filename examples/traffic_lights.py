@@ -1,15 +1,11 @@
 #!/usr/bin/env python3
 # SPDX-License-Identifier: MPL-2.0
-import time
 from enum import IntEnum, auto
 from dataclasses import dataclass
-from coord_dsl.event_loop import (
-    EventData,
-    produce_event,
-    consume_event,
-    reconfig_event_buffers,
-)
-from coord_dsl.fsm import FSMData, Transition, EventReaction, fsm_step
+from coord_dsl.clock import EventTimers, MonotonicClock, VirtualClock
+from coord_dsl.event_loop import EventData
+from coord_dsl.fsm import FSMData, Transition, EventReaction, StateHooks
+from coord_dsl.runner import LoopRunner
 
 
 class EventID(IntEnum):
@@ -90,22 +86,17 @@ def green_yel_behavior(u: UserData):
     u.redOn, u.yellowOn, u.greenOn = False, True, True
 
 
-def fsm_behavior(fsm: FSMData, user_data: UserData):
-    cs = fsm.current_state_index
-    if cs == StateID.RED:
-        red_behavior(user_data)
-    elif cs == StateID.RED_YELLOW:
-        red_yel_behavior(user_data)
-    elif cs == StateID.GREEN:
-        green_behavior(user_data)
-    elif cs == StateID.GREEN_YELLOW:
-        green_yel_behavior(user_data)
+def light_hooks(user_data: UserData, behavior) -> StateHooks:
+    """Hooks switching the lights when a state is entered"""
 
-    if consume_event(fsm.event_data, EventID.LIGHT_CHANGED):
+    def on_enter(fsm: FSMData):
+        behavior(user_data)
         generic_behavior(user_data)
 
+    return StateHooks(on_enter=on_enter)
 
-def main(global_timeout_secs: float, single_light_timeout_secs: float):
+
+def main(global_timeout_secs: float, single_light_timeout_secs: float, simulate: bool = False):
     transitions_dict = {
         TransitionID.START_RED: Transition(StateID.START, StateID.RED),
         TransitionID.RED_EXIT: Transition(StateID.RED, StateID.EXIT),
@@ -180,6 +171,12 @@ def main(global_timeout_secs: float, single_light_timeout_secs: float):
 
     events = EventData(len(EventID))
     user_data = UserData()
+    hooks_dict = {
+        StateID.RED: light_hooks(user_data, red_behavior),
+        StateID.RED_YELLOW: light_hooks(user_data, red_yel_behavior),
+        StateID.GREEN: light_hooks(user_data, green_behavior),
+        StateID.GREEN_YELLOW: light_hooks(user_data, green_yel_behavior),
+    }
     fsm = FSMData(
         event_data=events,
         num_states=len(StateID),
@@ -187,33 +184,22 @@ def main(global_timeout_secs: float, single_light_timeout_secs: float):
         end_state_index=StateID.EXIT,
         transitions=transitions,
         event_reactions=event_reactions,
+        state_hooks=[hooks_dict.get(sid) for sid in StateID],
     )
 
-    start_time = time.time()
-    last_light_time = start_time
+    clock = VirtualClock() if simulate else MonotonicClock()
+    timers = EventTimers(clock)
+    timers.start(EventID.SINGLE_LIGHT_TIMEOUT, single_light_timeout_secs, single_light_timeout_secs)
+    timers.start(EventID.GLOBAL_TIMEOUT, global_timeout_secs)
 
     print("Starting traffic light example")
-    while True:
-        if fsm.current_state_index == StateID.EXIT:
-            print("State machine completed successfully")
-            break
-
-        produce_event(fsm.event_data, EventID.STEP)
-
-        now = time.time()
-
-        if now - last_light_time > single_light_timeout_secs:
-            produce_event(events, EventID.SINGLE_LIGHT_TIMEOUT)
-            last_light_time = now
-
-        if now - start_time > global_timeout_secs:
-            produce_event(events, EventID.GLOBAL_TIMEOUT)
-
-        fsm_behavior(fsm, user_data)
-        fsm_step(fsm)
-        reconfig_event_buffers(events)
-
-        time.sleep(0.01)
+    # the behaviours only act on entering a state, so idle ticks can be skipped when simulating
+    runner = LoopRunner(
+        fsm, 0.01, step_event=EventID.STEP, clock=clock, timers=timers, skip_idle=simulate
+    )
+    stats = runner.run()
+    print("State machine completed successfully")
+    print(f"{stats.num_ticks} ticks, {stats.num_misses} deadline misses")
 
 
 if __name__ == "__main__":
@@ -237,5 +223,10 @@ if __name__ == "__main__":
         default=0.5,
         help="Timeout in seconds for each light",
     )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Run in simulated time instead of real time",
+    )
     args = parser.parse_args()
-    main(args.global_timeout, args.single_light_timeout)
+    main(args.global_timeout, args.single_light_timeout, args.simulate)
@@ -0,0 +1,254 @@
+# SPDX-License-Identifier: MPL-2.0
+import struct
+import sys
+from array import array
+from hashlib import blake2b
+from operator import attrgetter
+from typing import Sequence
+from coord_dsl.fsm import FSMData
+
+MAGIC = b"CDSF"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBII")
+_GROUP = struct.Struct("<16sII")
+
+_get_transitions = attrgetter("transitions")
+_get_reactions = attrgetter("event_reactions")
+_get_state = attrgetter("current_state_index")
+_get_current_mask = attrgetter("event_data.current_mask")
+_get_future_mask = attrgetter("event_data.future_mask")
+_get_payloads = attrgetter("event_data.payloads")
+
+
+def table_digest(fsm: FSMData) -> bytes:
+    """Digest of the model tables of an FSM instance, i.e. everything but its runtime state
+
+    The tables are hashed as packed integer arrays, so that the digest only depends on the
+    indices and masks and not on how they are represented, e.g. as IntEnum members.
+    """
+    transitions = fsm.transitions
+    reactions = fsm.event_reactions
+    width = _event_width(fsm.event_data.num_events)
+
+    sizes = array("q", (fsm.num_states, fsm.start_state_index, fsm.end_state_index))
+    sizes.extend((fsm.event_data.num_events, len(transitions), len(reactions)))
+    ends = array("q")
+    for transition in transitions:
+        ends.append(transition.start_state_index)
+        ends.append(transition.end_state_index)
+    # transition index, number of condition terms and of fired events of each reaction
+    rows = array("q")
+    fired = array("q")
+    masks = []
+    for reaction in reactions:
+        rows.append(reaction.transition_index)
+        rows.append(len(reaction.condition_masks))
+        rows.append(len(reaction.fired_event_indices))
+        fired.extend(reaction.fired_event_indices)
+        for required, excluded in reaction.condition_masks:
+            masks.append(required)
+            masks.append(excluded)
+
+    digest = blake2b(digest_size=16)
+    for values in (sizes, ends, rows, fired):
+        digest.update(_to_bytes(values))
+    digest.update(_pack_events(masks, width))
+    return digest.digest()
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _pack_events(buffers: list[int], width: int) -> bytes:
+    if width == 8:
+        return _to_bytes(array("Q", buffers))
+    return b"".join(buffer.to_bytes(width, "little") for buffer in buffers)
+
+
+def _unpack_events(data: bytes, width: int) -> list[int]:
+    if width == 8:
+        return _from_bytes("Q", data).tolist()
+    return [
+        int.from_bytes(data[offset : offset + width], "little")
+        for offset in range(0, len(data), width)
+    ]
+
+
+def _event_width(num_events: int) -> int:
+    # bitmasks of up to 64 events are packed as 64-bit integers
+    return 8 if num_events <= 64 else (num_events + 7) // 8
+
+
+def _model_key(fsm: FSMData) -> tuple[int, int, int, int]:
+    return (
+        fsm.num_states,
+        fsm.start_state_index,
+        fsm.end_state_index,
+        fsm.event_data.num_events,
+    )
+
+
+def _group_by_tables(fleet: Sequence[FSMData]) -> dict[bytes, list[int]]:
+    """Positions of the instances in the fleet, grouped by the digest of their tables
+
+    The digest is computed once per group of instances with equal tables. Tables shared by
+    instances, e.g. those of the fast-import `create_fsm`, are recognized by identity, and
+    other tables are compared with the tables of each group found so far.
+    """
+    transitions_ids = list(map(id, map(_get_transitions, fleet)))
+    reactions_ids = list(map(id, map(_get_reactions, fleet)))
+    if len(set(transitions_ids)) == 1 and len(set(reactions_ids)) == 1:
+        # the common case of a fleet of a single model sharing its tables
+        first = _model_key(fleet[0])
+        if all(_model_key(fsm) == first for fsm in fleet):
+            return {table_digest(fleet[0]): list(range(len(fleet)))}
+
+    # (model key, transitions, reactions) and positions of each group
+    tables = []
+    members = []
+    group_by_ids = {}
+    for position, fsm in enumerate(fleet):
+        ids = (transitions_ids[position], reactions_ids[position])
+        key = _model_key(fsm)
+        group = group_by_ids.get(ids)
+        if group is None or tables[group][0] != key:
+            for group, (known_key, transitions, reactions) in enumerate(tables):
+                if (
+                    known_key == key
+                    and fsm.transitions == transitions
+                    and fsm.event_reactions == reactions
+                ):
+                    break
+            else:
+                group = len(tables)
+                tables.append((key, fsm.transitions, fsm.event_reactions))
+                members.append([])
+            group_by_ids[ids] = group
+        members[group].append(position)
+
+    groups = {}
+    for positions in members:
+        digest = table_digest(fleet[positions[0]])
+        groups.setdefault(digest, []).extend(positions)
+    return groups
+
+
+def _check_payloads(fleet: Sequence[FSMData]):
+    for position, payloads in enumerate(map(_get_payloads, fleet)):
+        if payloads is not None and (payloads.current_produced or payloads.future_produced):
+            raise ValueError(
+                f"FSM instance {position} has pending event payloads, which are not captured "
+                "by fleet snapshots"
+            )
+
+
+def snapshot_fleet(fleet: Sequence[FSMData]) -> bytes:
+    """Serializes the current state and event buffers of each FSM instance into a binary blob
+
+    The model tables are not copied but referenced by their `table_digest`. Instances are
+    grouped by digest, and the state indices and event buffers of a group are stored as packed
+    arrays.
+
+    Event payloads are not captured, so a ValueError is raised if any instance has payloads
+    pending in its `EventPayloads`, e.g. when snapshotting between producing and consuming.
+    """
+    _check_payloads(fleet)
+    groups = _group_by_tables(fleet)
+    chunks = [_HEADER.pack(MAGIC, VERSION, len(fleet), len(groups))]
+    for digest, positions in groups.items():
+        num_events = fleet[positions[0]].event_data.num_events
+        width = _event_width(num_events)
+        members = fleet if len(groups) == 1 else [fleet[position] for position in positions]
+        chunks.append(_GROUP.pack(digest, num_events, len(positions)))
+        chunks.append(_to_bytes(array("I", positions)))
+        chunks.append(_to_bytes(array("I", map(_get_state, members))))
+        chunks.append(_pack_events(list(map(_get_current_mask, members)), width))
+        chunks.append(_pack_events(list(map(_get_future_mask, members)), width))
+    return b"".join(chunks)
+
+
+def restore_fleet(blob: bytes, fleet: Sequence[FSMData]):
+    """Restores a snapshot of `snapshot_fleet` into the instances of `fleet`
+
+    The fleet must contain the same number of instances as the snapshot, in the same order and
+    with tables of the same digests, e.g. when recreated with the same models after a restart.
+    Pending payloads of the instances are cleared. A ValueError is raised, without restoring
+    any instance, if the blob is not a valid snapshot for the fleet.
+    """
+    if len(blob) < _HEADER.size:
+        raise ValueError("Not an FSM fleet snapshot")
+    magic, version, num_instances, num_groups = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an FSM fleet snapshot")
+    if version != VERSION:
+        raise ValueError(f"Unsupported snapshot version '{version}'")
+    if num_instances != len(fleet):
+        raise ValueError(
+            f"Snapshot contains {num_instances} instances, but the fleet has {len(fleet)}"
+        )
+
+    groups = _group_by_tables(fleet)
+    offset = _HEADER.size
+    # sections of all groups are validated before any instance is restored
+    sections_by_group = []
+    for _ in range(num_groups):
+        if len(blob) < offset + _GROUP.size:
+            raise ValueError("Snapshot is truncated")
+        digest, num_events, count = _GROUP.unpack_from(blob, offset)
+        offset += _GROUP.size
+        width = _event_width(num_events)
+
+        sections = []
+        for size in (4 * count, 4 * count, width * count, width * count):
+            if len(blob) < offset + size:
+                raise ValueError("Snapshot is truncated")
+            sections.append(blob[offset : offset + size])
+            offset += size
+        positions = _from_bytes("I", sections[0])
+        states = _from_bytes("I", sections[1])
+
+        group = groups.get(digest, ())
+        if not group or not set(positions) <= set(group):
+            raise ValueError(
+                f"Snapshot tables '{digest.hex()}' do not match the tables of the fleet instances"
+            )
+        fsm = fleet[group[0]]
+        if num_events != fsm.event_data.num_events or (states and max(states) >= fsm.num_states):
+            raise ValueError(f"Snapshot group '{digest.hex()}' is inconsistent with its tables")
+        sections_by_group.append(
+            (
+                positions,
+                states,
+                _unpack_events(sections[2], width),
+                _unpack_events(sections[3], width),
+            )
+        )
+
+    restored = set()
+    for positions, _, _, _ in sections_by_group:
+        restored.update(positions)
+    if len(restored) != num_instances or offset != len(blob):
+        raise ValueError("Snapshot is inconsistent with its header")
+
+    for positions, states, current_events, future_events in sections_by_group:
+        for position, state, current, future in zip(
+            positions, states, current_events, future_events
+        ):
+            fsm = fleet[position]
+            fsm.current_state_index = state
+            fsm.event_data.current_mask = current
+            fsm.event_data.future_mask = future
+            if fsm.event_data.payloads is not None:
+                fsm.event_data.payloads.clear()
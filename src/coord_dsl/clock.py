@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: MPL-2.0
+import heapq
+import itertools
+import time
+from typing import Protocol
+from coord_dsl.event_loop import EventData, produce_event
+
+
+class Clock(Protocol):
+    """Source of time, in seconds, for the loop runner and event timers"""
+
+    def now(self) -> float: ...
+
+    def sleep_until(self, deadline: float): ...
+
+
+class MonotonicClock:
+    """Real time from `time.monotonic`"""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep_until(self, deadline: float):
+        time.sleep(max(deadline - time.monotonic(), 0.0))
+
+
+class VirtualClock:
+    """Simulated time, which only passes when sleeping or advancing the clock
+
+    Sleeping jumps to the deadline without waiting, so that runs are deterministic and take
+    no longer than the computation they contain. `advance` can be used by behaviours to
+    simulate the time taken by their work.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep_until(self, deadline: float):
+        self._now = max(self._now, deadline)
+
+    def advance(self, duration: float):
+        assert duration >= 0, f"Cannot advance the clock by a negative duration '{duration}'"
+        self._now += duration
+
+
+class EventTimers:
+    """Timers producing an event once they are due
+
+    Due times are absolute on the given clock. Periodic timers are rescheduled from their
+    previous due time, so that they do not drift with the time at which they are checked;
+    periods missed entirely are skipped. One-shot timers are forgotten once they fired.
+    """
+
+    def __init__(self, clock: Clock):
+        self.clock = clock
+        self._queue = []
+        self._handles = itertools.count()
+        # handles of the running timers, the queue entries of other handles were cancelled
+        self._running = set()
+
+    def start(self, event_index: int, delay: float, period: float | None = None) -> int:
+        """Starts a timer producing `event_index` after `delay`, and then every `period`
+
+        Returns a handle for `cancel`.
+        """
+        assert delay >= 0, f"Timer delay must not be negative, got '{delay}'"
+        assert period is None or period > 0, f"Timer period must be positive, got '{period}'"
+        handle = next(self._handles)
+        self._running.add(handle)
+        heapq.heappush(self._queue, (self.clock.now() + delay, handle, event_index, period))
+        return handle
+
+    def cancel(self, handle: int):
+        """Stops a timer, doing nothing if it already fired once-only or was cancelled"""
+        self._running.discard(handle)
+
+    def next_due(self) -> float | None:
+        """Due time of the next timer, or None if no timer is running"""
+        while self._queue and self._queue[0][1] not in self._running:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def produce_due(self, event_data: EventData) -> int:
+        """Produces the events of all due timers, returning the number of events produced"""
+        now = self.clock.now()
+        produced = 0
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                return produced
+
+            _, handle, event_index, period = heapq.heappop(self._queue)
+            produce_event(event_data, event_index)
+            produced += 1
+            if period is None:
+                self._running.discard(handle)
+            else:
+                due += period * (int((now - due) // period) + 1)
+                heapq.heappush(self._queue, (due, handle, event_index, period))
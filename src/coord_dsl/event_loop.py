@@ -1,38 +1,233 @@
 # SPDX-License-Identifier: MPL-2.0
+from array import array
+
+OVERFLOW_POLICIES = ("drop", "coalesce", "error")
+
+
+class EventPayloads:
+    """Current and future payload slots of each event, preallocated with a fixed capacity
+
+    Payloads produced with an event are stored in the future slots of the event, and become
+    current together with the event in `reconfig_event_buffers`, which swaps the slots instead
+    of reallocating them. If a `typecode` is given, the slots are arrays of that type, e.g. "d"
+    for floats, so that numeric payloads are stored without allocating objects.
+
+    When more payloads than the capacity are produced for an event within a step, the
+    `overflow` policy applies:
+    - "drop": the new payload is dropped
+    - "coalesce": the new payload replaces the most recent one
+    - "error": an `OverflowError` is raised
+    """
+
+    def __init__(
+        self,
+        num_events: int,
+        capacity: int = 1,
+        overflow: str = "drop",
+        typecode: str | None = None,
+    ):
+        assert capacity > 0, f"Payload capacity must be positive, got '{capacity}'"
+        assert overflow in OVERFLOW_POLICIES, (
+            f"Unknown overflow policy '{overflow}', supported policies are: {OVERFLOW_POLICIES}"
+        )
+        self.capacity = capacity
+        self.overflow = overflow
+        self.current_slots = self._allocate(num_events, capacity, typecode)
+        self.future_slots = self._allocate(num_events, capacity, typecode)
+        self.current_counts = [0] * num_events
+        self.future_counts = [0] * num_events
+        # events with payloads, so that only their counts are reset when swapping
+        self.current_produced = []
+        self.future_produced = []
+
+    @staticmethod
+    def _allocate(num_events: int, capacity: int, typecode: str | None) -> list:
+        if typecode is None:
+            return [[None] * capacity for _ in range(num_events)]
+        return [array(typecode, [0] * capacity) for _ in range(num_events)]
+
+    def push(self, event_index: int, payload):
+        count = self.future_counts[event_index]
+        if count == 0:
+            self.future_produced.append(event_index)
+        if count < self.capacity:
+            self.future_slots[event_index][count] = payload
+            self.future_counts[event_index] = count + 1
+        elif self.overflow == "coalesce":
+            self.future_slots[event_index][count - 1] = payload
+        elif self.overflow == "error":
+            raise OverflowError(
+                f"More than {self.capacity} payloads produced for event '{event_index}'"
+            )
+
+    def clear(self):
+        """Drops all current and future payloads"""
+        for counts, produced in (
+            (self.current_counts, self.current_produced),
+            (self.future_counts, self.future_produced),
+        ):
+            for event_index in produced:
+                counts[event_index] = 0
+            produced.clear()
+
+    def swap(self):
+        self.current_slots, self.future_slots = self.future_slots, self.current_slots
+        self.current_counts, self.future_counts = self.future_counts, self.current_counts
+        self.current_produced, self.future_produced = self.future_produced, self.current_produced
+        # stale payloads are left in the slots and overwritten by the next producers
+        for event_index in self.future_produced:
+            self.future_counts[event_index] = 0
+        self.future_produced.clear()
+
+
+class EventBuffer:
+    """List-like view of one of the event bitmasks of an `EventData`, indexed by event
+
+    Keeps the former `list[bool]` buffer API working, e.g. `event_data.current_events[i]` or
+    `event_data.future_events[i] = True`, on top of the packed masks.
+    """
+
+    __slots__ = ("_event_data", "_mask_name")
+
+    def __init__(self, event_data: "EventData", mask_name: str):
+        self._event_data = event_data
+        self._mask_name = mask_name
+
+    def _index(self, index: int) -> int:
+        num_events = self._event_data.num_events
+        if index < 0:
+            index += num_events
+        if not 0 <= index < num_events:
+            raise IndexError(f"Event index '{index}' out of range [0, {num_events})")
+        return index
+
+    def __len__(self) -> int:
+        return self._event_data.num_events
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return bool(getattr(self._event_data, self._mask_name) >> self._index(index) & 1)
+
+    def __setitem__(self, index: int, value: bool):
+        bit = 1 << self._index(index)
+        mask = getattr(self._event_data, self._mask_name)
+        setattr(self._event_data, self._mask_name, mask | bit if value else mask & ~bit)
+
+    def __iter__(self):
+        mask = getattr(self._event_data, self._mask_name)
+        return (bool(mask >> i & 1) for i in range(self._event_data.num_events))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, EventBuffer):
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def _pack_buffer(events) -> int:
+    if isinstance(events, int):
+        return events
+    mask = 0
+    for i, occurred in enumerate(events):
+        if occurred:
+            mask |= 1 << i
+    return mask
+
+
 class EventData:
-    def __init__(self, num_events):
+    """Current and future event buffers, packed as bitmasks with bit i set if event i occurred
+
+    The masks are `current_mask` and `future_mask`. `current_events` and `future_events` are
+    list-like views of them, see `EventBuffer`, and can also be assigned a list of booleans.
+    `payloads` optionally carries data produced with the events, see `EventPayloads`.
+    """
+
+    def __init__(self, num_events, payloads: EventPayloads | None = None):
         self.num_events = num_events
-        self.current_events = [False] * num_events
-        self.future_events = [False] * num_events
+        self.current_mask = 0
+        self.future_mask = 0
+        self.payloads = payloads
+
+    @property
+    def current_events(self) -> EventBuffer:
+        return EventBuffer(self, "current_mask")
+
+    @current_events.setter
+    def current_events(self, events):
+        self.current_mask = _pack_buffer(events)
 
+    @property
+    def future_events(self) -> EventBuffer:
+        return EventBuffer(self, "future_mask")
 
-def produce_event(event_data: EventData, event_index: int):
-    assert event_data.future_events is not None, "Event buffers not initialized"
+    @future_events.setter
+    def future_events(self, events):
+        self.future_mask = _pack_buffer(events)
+
+
+def produce_event(event_data: EventData, event_index: int, payload=None):
+    assert event_data.future_mask is not None, "Event buffers not initialized"
     assert (
         0 <= event_index < event_data.num_events
     ), f"Event index '{event_index}' out of range [0, {event_data.num_events})"
-    event_data.future_events[event_index] = True
+    event_data.future_mask |= 1 << event_index
+    if payload is not None:
+        assert event_data.payloads is not None, "Event payloads not initialized"
+        event_data.payloads.push(event_index, payload)
 
 
 def consume_event(event_data: EventData, event_index: int) -> bool:
-    assert event_data.current_events is not None, "Event buffers not initialized"
+    assert event_data.current_mask is not None, "Event buffers not initialized"
     assert (
         0 <= event_index < event_data.num_events
     ), f"Event index '{event_index}' out of range [0, {event_data.num_events})"
-    return event_data.current_events[event_index]
+    return bool(event_data.current_mask >> event_index & 1)
+
+
+def consume_payloads(event_data: EventData, event_index: int) -> list:
+    """Payloads produced with the event in the previous step, in the order they were produced"""
+    payloads = event_data.payloads
+    assert payloads is not None, "Event payloads not initialized"
+    return payloads.current_slots[event_index][: payloads.current_counts[event_index]]
+
+
+def consume_latest_payload(event_data: EventData, event_index: int, default=None):
+    """Most recent payload produced with the event in the previous step, without copying"""
+    payloads = event_data.payloads
+    assert payloads is not None, "Event payloads not initialized"
+    count = payloads.current_counts[event_index]
+    if count == 0:
+        return default
+    return payloads.current_slots[event_index][count - 1]
+
+
+def consume_event_condition(event_data: EventData, condition_masks: list[tuple[int, int]]) -> bool:
+    """Checks a composition of events against the current events
+
+    The condition is given as a disjunction of (required, excluded) event bitmasks, i.e. it is
+    satisfied if, for any of the pairs, all required events and none of the excluded events
+    occurred.
+    """
+    assert event_data.current_mask is not None, "Event buffers not initialized"
+    current_events = event_data.current_mask
+    for required, excluded in condition_masks:
+        if current_events & required == required and not current_events & excluded:
+            return True
+    return False
 
 
 def reconfig_event_buffers(event_data: EventData):
     assert (
-        event_data.future_events is not None and event_data.current_events is not None
+        event_data.future_mask is not None and event_data.current_mask is not None
     ), "Event buffers not initialized"
 
-    # swap current and future event buffers
-    event_data.current_events, event_data.future_events = (
-        event_data.future_events,
-        event_data.current_events,
-    )
-
-    # reset all future events
-    for i in range(event_data.num_events):
-        event_data.future_events[i] = False
+    # future events become current, and all future events are reset
+    event_data.current_mask = event_data.future_mask
+    event_data.future_mask = 0
+    if event_data.payloads is not None:
+        event_data.payloads.swap()
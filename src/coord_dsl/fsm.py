@@ -1,6 +1,10 @@
 # SPDX-License-Identifier: MPL-2.0
 from dataclasses import dataclass
-from coord_dsl.event_loop import EventData, produce_event, consume_event
+from typing import TYPE_CHECKING, Callable
+from coord_dsl.event_loop import EventData, produce_event, consume_event_condition
+
+if TYPE_CHECKING:
+    from coord_dsl.monitor import MonitorSlot
 
 
 @dataclass
@@ -11,9 +15,33 @@ class Transition:
 
 @dataclass
 class EventReaction:
-    condition_event_index: int
+    # None if the reaction is conditioned on an event composition
+    condition_event_index: int | None
     transition_index: int
     fired_event_indices: list[int]
+    # disjunction of (required, excluded) event bitmasks, see `consume_event_condition`
+    condition_masks: list[tuple[int, int]] | None = None
+
+    def __post_init__(self):
+        if self.condition_masks is None:
+            assert (
+                self.condition_event_index is not None
+            ), "EventReaction requires either a condition event or condition masks"
+            self.condition_masks = [(1 << self.condition_event_index, 0)]
+
+
+@dataclass
+class StateHooks:
+    """Behaviour callbacks of a state, each taking the `FSMData`
+
+    `on_enter` and `on_exit` are called by `fsm_step` when a transition changes the current
+    state, i.e. not for self-transitions nor for the start state when the FSM is created.
+    `on_step` is called by `fsm_dispatch` while the state is the current state.
+    """
+
+    on_enter: Callable[["FSMData"], None] | None = None
+    on_exit: Callable[["FSMData"], None] | None = None
+    on_step: Callable[["FSMData"], None] | None = None
 
 
 @dataclass
@@ -25,10 +53,79 @@ class FSMData:
     transitions: list[Transition]
     event_reactions: list[EventReaction]
     current_state_index: int | None = None
+    # hooks of each state, indexed by state
+    state_hooks: list[StateHooks | None] | None = None
+    # shared-memory slot mirroring the state after each step, see `StateMonitor.attach`
+    monitor: "MonitorSlot | None" = None
 
     def __post_init__(self):
         if self.current_state_index is None:
             self.current_state_index = self.start_state_index
+        assert (
+            self.state_hooks is None or len(self.state_hooks) == self.num_states
+        ), "State hooks must be given for each state"
+
+
+def fsm_from_ir(ir: dict, state_hooks: list[StateHooks | None] | None = None) -> FSMData:
+    """Creates the FSM data structure directly from the integer-indexed IR of `gen_json`
+
+    The index arrays of the IR are used as is, so that the result matches the `create_fsm`
+    function of the generated Python code without generating and importing it.
+    """
+    transitions = [
+        Transition(from_state, to_state)
+        for from_state, to_state in zip(ir["from_state"], ir["to_state"])
+    ]
+
+    fires_offsets = ir["fires_offsets"]
+    term_offsets = ir["term_offsets"]
+    event_reactions = []
+    for reaction, (when_event, transition) in enumerate(
+        zip(ir["when_event"], ir["do_transition"])
+    ):
+        terms = range(term_offsets[reaction], term_offsets[reaction + 1])
+        event_reactions.append(
+            EventReaction(
+                condition_event_index=when_event if when_event >= 0 else None,
+                transition_index=transition,
+                fired_event_indices=ir["fires_events"][
+                    fires_offsets[reaction] : fires_offsets[reaction + 1]
+                ],
+                condition_masks=(
+                    None
+                    if when_event >= 0
+                    else [(ir["term_requires"][k], ir["term_excludes"][k]) for k in terms]
+                ),
+            )
+        )
+
+    return FSMData(
+        event_data=EventData(len(ir["events"])),
+        num_states=len(ir["states"]),
+        start_state_index=ir["start_state"],
+        end_state_index=ir["end_state"],
+        transitions=transitions,
+        event_reactions=event_reactions,
+        state_hooks=state_hooks,
+    )
+
+
+def _call_hook(fsm: FSMData, hook_name: str):
+    if fsm.state_hooks is None:
+        return
+    hooks = fsm.state_hooks[fsm.current_state_index]
+    if hooks is None:
+        return
+    hook = getattr(hooks, hook_name)
+    if hook is not None:
+        hook(fsm)
+
+
+def fsm_dispatch(fsm: FSMData):
+    """Calls the `on_step` hook of the current state, if any"""
+    assert fsm.current_state_index is not None
+    assert 0 <= fsm.current_state_index < fsm.num_states
+    _call_hook(fsm, "on_step")
 
 
 def fsm_step(fsm: FSMData):
@@ -40,12 +137,16 @@ def fsm_step(fsm: FSMData):
 
     # Exit if end state is reached
     if fsm.current_state_index == fsm.end_state_index:
+        if fsm.monitor is not None:
+            fsm.monitor.record(fsm.current_state_index, None)
         return
 
+    fired_reaction = None
+
     # Process reactions in order (priority by list order)
-    for reaction in fsm.event_reactions:
+    for reaction_index, reaction in enumerate(fsm.event_reactions):
         # Skip if event condition not triggered
-        if not consume_event(fsm.event_data, reaction.condition_event_index):
+        if not consume_event_condition(fsm.event_data, reaction.condition_masks):
             continue
 
         trans_index = reaction.transition_index
@@ -63,13 +164,24 @@ def fsm_step(fsm: FSMData):
         assert (
             0 <= transition.end_state_index < fsm.num_states
         ), f"Transition end state index '{transition.end_state_index}' out of range [0, {fsm.num_states})"
+        state_changed = transition.end_state_index != fsm.current_state_index
+        if state_changed:
+            _call_hook(fsm, "on_exit")
         fsm.current_state_index = transition.end_state_index
 
         # Fire any resulting events
         for idx in reaction.fired_event_indices:
             produce_event(fsm.event_data, idx)
 
+        if state_changed:
+            _call_hook(fsm, "on_enter")
+
+        fired_reaction = reaction_index
+
         # Stop after the first matching reaction
         # This implies that the order of reactions and reactions signifies the priority in which
         # they're handled, and that only the first transition will be taken into account.
         break
+
+    if fsm.monitor is not None:
+        fsm.monitor.record(fsm.current_state_index, fired_reaction)
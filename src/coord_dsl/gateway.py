@@ -0,0 +1,167 @@
+# SPDX-License-Identifier: MPL-2.0
+import json
+import logging
+import os
+import socket
+from enum import IntEnum
+from typing import Sequence
+from coord_dsl.event_loop import produce_event
+from coord_dsl.fsm import FSMData
+
+logger = logging.getLogger(__name__)
+
+MAX_DATAGRAM_SIZE = 65535
+
+
+class EventGateway:
+    """Exchanges events and state changes of an FSM with other processes over datagrams
+
+    The gateway binds a non-blocking datagram socket, on UDP if `address` is a (host, port)
+    tuple and on a Unix domain socket if it is a path. Each datagram is a JSON list of events,
+    or an object with such a list under "events", where an event is given by its name, its
+    index, or an object {"event": name or index, "payload": value} to produce it with a
+    payload. Event names are resolved with the `event_ids` enum, e.g. the generated `EventID`.
+
+    `poll` drains all received datagrams and produces their events, and is meant to be called
+    at the end of a tick before `reconfig_event_buffers`. Payloads are only accepted if the FSM's
+    `EventData` has `EventPayloads`; payloads which cannot be stored are dropped and counted
+    while their events are still produced. `publish` sends a JSON object
+    {"state": name, "index": index, "previous": name} to each subscriber address whenever the
+    current state changed since the previous call. Invalid messages are logged and skipped.
+    """
+
+    def __init__(
+        self,
+        fsm: FSMData,
+        address: tuple[str, int] | str,
+        event_ids: type[IntEnum] | None = None,
+        state_ids: type[IntEnum] | None = None,
+        subscribers: Sequence[tuple[str, int] | str] = (),
+    ):
+        self.fsm = fsm
+        self.event_ids = event_ids
+        self.state_ids = state_ids
+        self.subscribers = list(subscribers)
+        self.num_received = 0
+        self.num_invalid = 0
+        self.num_dropped_payloads = 0
+        self._published_state = fsm.current_state_index
+
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self._path = address if family == socket.AF_UNIX else None
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(address)
+
+    @property
+    def address(self) -> tuple[str, int] | str:
+        """Bound address, e.g. to find the port chosen when binding to port 0"""
+        return self.socket.getsockname()
+
+    def _event_index(self, event) -> int:
+        if isinstance(event, str):
+            if self.event_ids is None:
+                raise ValueError(f"Cannot resolve event name '{event}' without event IDs")
+            return self.event_ids[event]
+        # JSON true & false decode to bools, which are ints in Python
+        if (
+            isinstance(event, int)
+            and not isinstance(event, bool)
+            and 0 <= event < self.fsm.event_data.num_events
+        ):
+            return event
+        raise ValueError(f"Invalid event '{event}'")
+
+    def _decode(self, datagram: bytes) -> list[tuple[int, object]]:
+        message = json.loads(datagram)
+        if isinstance(message, dict):
+            message = message["events"]
+        if not isinstance(message, list):
+            raise ValueError("Expected a list of events")
+
+        events = []
+        for entry in message:
+            if isinstance(entry, dict):
+                payload = entry.get("payload")
+                if payload is not None and self.fsm.event_data.payloads is None:
+                    raise ValueError("Payloads are not supported, the FSM has no payload buffers")
+                events.append((self._event_index(entry["event"]), payload))
+            else:
+                events.append((self._event_index(entry), None))
+        return events
+
+    def poll(self) -> int:
+        """Produces the events of all received datagrams, returning the number of events"""
+        event_data = self.fsm.event_data
+        events_mask = 0
+        num_events = 0
+        try:
+            while True:
+                try:
+                    datagram = self.socket.recv(MAX_DATAGRAM_SIZE)
+                except BlockingIOError:
+                    break
+
+                self.num_received += 1
+                try:
+                    events = self._decode(datagram)
+                except (ValueError, KeyError, TypeError) as e:
+                    # json.JSONDecodeError is a ValueError
+                    self.num_invalid += 1
+                    logger.warning("Skipping invalid event message: %s", e)
+                    continue
+
+                for event_index, payload in events:
+                    if payload is None:
+                        events_mask |= 1 << event_index
+                        continue
+                    try:
+                        produce_event(event_data, event_index, payload)
+                    except (OverflowError, TypeError) as e:
+                        # the event is produced, only its payload is lost, e.g. when the payload
+                        # buffers are full with the "error" policy or of another type
+                        self.num_dropped_payloads += 1
+                        logger.warning("Dropping payload of event '%d': %s", event_index, e)
+                num_events += len(events)
+        finally:
+            # events without payloads are produced at once, also if receiving failed
+            event_data.future_mask |= events_mask
+        return num_events
+
+    def publish(self) -> bool:
+        """Sends the current state to the subscribers if it changed, returning whether it did"""
+        state = self.fsm.current_state_index
+        if state == self._published_state:
+            return False
+
+        message = {
+            "state": self._state_name(state),
+            "index": state,
+            "previous": self._state_name(self._published_state),
+        }
+        self._published_state = state
+        datagram = json.dumps(message).encode()
+        for subscriber in self.subscribers:
+            try:
+                self.socket.sendto(datagram, subscriber)
+            except OSError as e:
+                logger.warning("Failed to publish state to '%s': %s", subscriber, e)
+        return True
+
+    def _state_name(self, state: int) -> str | None:
+        if state is None:
+            return None
+        if self.state_ids is None:
+            return str(state)
+        return self.state_ids(state).name
+
+    def close(self):
+        self.socket.close()
+        if self._path is not None and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -3,7 +3,18 @@ from coord_dsl.generators.common import IHasNamespaceDeclare, NamedNamespaceObje
 
 
 class State(NamedNamespaceObject):
-    pass
+    def __init__(self, parent, name, states=None, start_state=None, transitions=None,
+                 reactions=None):
+        super().__init__(parent=parent, name=name)
+        # sub-FSM of a composite state, empty for leaf states
+        self.states: list[State] = states or []
+        self.start_state: Optional[State] = start_state
+        self.transitions: list[Transition] = transitions or []
+        self.reactions: list[Reaction] = reactions or []
+
+    @property
+    def is_composite(self) -> bool:
+        return bool(self.states)
 
 class Event(NamedNamespaceObject):
     pass
@@ -21,10 +32,77 @@ class FiredEvent:
         self.event: Optional[Event] = kwargs.get("event")
 
 
+# Conjunction of events that must occur and events that must not occur
+ConditionTerm = tuple[frozenset[Event], frozenset[Event]]
+
+
+def _conjoin(terms_a: list[ConditionTerm], terms_b: list[ConditionTerm]) -> list[ConditionTerm]:
+    return [
+        (req_a | req_b, excl_a | excl_b) for req_a, excl_a in terms_a for req_b, excl_b in terms_b
+    ]
+
+
+def _negate(terms: list[ConditionTerm]) -> list[ConditionTerm]:
+    # De Morgan: the negation of a disjunction is the conjunction of the negated terms
+    result = [(frozenset(), frozenset())]
+    for requires, excludes in terms:
+        negated = [(frozenset(), frozenset([e])) for e in requires]
+        negated += [(frozenset([e]), frozenset()) for e in excludes]
+        result = _conjoin(result, negated)
+    return result
+
+
+def _simplify(terms: list[ConditionTerm]) -> list[ConditionTerm]:
+    # drop unsatisfiable terms, then terms implied by another term
+    terms = [term for term in dict.fromkeys(terms) if not term[0] & term[1]]
+    return [
+        term
+        for term in terms
+        if not any(
+            other != term and other[0] <= term[0] and other[1] <= term[1] for other in terms
+        )
+    ]
+
+
+class EventLiteral:
+    def __init__(self, **kwargs):
+        self.negated: bool = kwargs.get("negated", False)
+        self.event: Optional[Event] = kwargs.get("event")
+        self.condition: Optional[EventCondition] = kwargs.get("condition")
+
+    def terms(self) -> list[ConditionTerm]:
+        if self.event is not None:
+            terms = [(frozenset([self.event]), frozenset())]
+        else:
+            assert self.condition is not None
+            terms = self.condition.terms()
+        return _negate(terms) if self.negated else terms
+
+
+class EventConjunction:
+    def __init__(self, **kwargs):
+        self.operands: list[EventLiteral] = kwargs.get("operands", [])
+
+    def terms(self) -> list[ConditionTerm]:
+        terms = [(frozenset(), frozenset())]
+        for operand in self.operands:
+            terms = _conjoin(terms, operand.terms())
+        return terms
+
+
+class EventCondition:
+    def __init__(self, **kwargs):
+        self.operands: list[EventConjunction] = kwargs.get("operands", [])
+
+    def terms(self) -> list[ConditionTerm]:
+        """Condition in disjunctive normal form, i.e. satisfied if any of the terms is"""
+        return _simplify([term for operand in self.operands for term in operand.terms()])
+
+
 class Reaction(NamedNamespaceObject):
     def __init__(self, parent, name, when, do, fires):
         super().__init__(parent=parent, name=name)
-        self.when: Event = when
+        self.when: EventCondition = when
         self.do: Transition = do
         self.fires: list[FiredEvent] = fires
 
@@ -32,6 +110,18 @@ class Reaction(NamedNamespaceObject):
     def fired_events(self) -> list[Event]:
         return [f.event for f in self.fires if f.event is not None]
 
+    @property
+    def condition_terms(self) -> list[ConditionTerm]:
+        return self.when.terms()
+
+    @property
+    def when_event(self) -> Optional[Event]:
+        """The event of a condition on a single event, None for event compositions"""
+        terms = self.condition_terms
+        if len(terms) != 1 or len(terms[0][0]) != 1 or terms[0][1]:
+            return None
+        return next(iter(terms[0][0]))
+
 
 class FSM(IHasNamespaceDeclare):
     def __init__(self, parent, ns, name, description, states, start_state, 
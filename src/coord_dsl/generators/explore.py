@@ -0,0 +1,312 @@
+# SPDX-License-Identifier: MPL-2.0
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from coord_dsl.generators.fsm_graph import reaction_fires, reaction_terms
+
+# maximum number of events a state with negated events in its conditions may react to, since
+# all combinations of these events are tried as inputs
+MAX_NEGATED_STATE_EVENTS = 20
+
+# smallest BFS level for which the expansion is split across processes
+_MIN_PARALLEL_LEVEL = 1024
+
+
+@dataclass
+class ExplorationReport:
+    """Result of `explore_ir`"""
+
+    num_configurations: int
+    reachable_states: list[str]
+    unreachable_states: list[str]
+    deadlock_states: list[str]
+    trap_states: list[str]
+    end_reachable: bool
+    events: list[str] = field(repr=False)
+    # BFS parent & input of each configuration, and the first configuration of each state
+    _parents: dict[int, tuple[int, int] | None] = field(repr=False)
+    _first_configs: dict[str, int] = field(repr=False)
+
+    def shortest_inputs(self, state: str) -> list[list[str]] | None:
+        """Shortest sequence of input event sets, one per step, from the start state to `state`
+
+        Returns None if the state is not reachable. Sequences are rebuilt from the BFS tree on
+        request, since storing them for all states takes memory quadratic in their length.
+        """
+        config = self._first_configs.get(state)
+        if config is None:
+            return None
+
+        sequence = []
+        while self._parents[config] is not None:
+            config, inputs_mask = self._parents[config]
+            sequence.append(
+                [
+                    self.events[index]
+                    for index in range(inputs_mask.bit_length())
+                    if inputs_mask >> index & 1
+                ]
+            )
+        return sequence[::-1]
+
+    @property
+    def end_always_reachable(self) -> bool:
+        return self.end_reachable and not self.trap_states
+
+    def summary(self) -> str:
+        lines = [
+            f"Exploration: {self.num_configurations} configuration(s), "
+            f"{len(self.reachable_states)} reachable state(s)"
+        ]
+        for state in self.unreachable_states:
+            lines.append(f"  state '{state}': not reachable from the start state")
+        for state in self.deadlock_states:
+            lines.append(f"  state '{state}': deadlock, no reaction can ever fire")
+        for state in self.trap_states:
+            lines.append(f"  state '{state}': end state not reachable from some configurations")
+        if not self.end_reachable:
+            lines.append("  end state not reachable from the start state")
+        return "\n".join(lines)
+
+
+@dataclass
+class _Tables:
+    """Index-based reaction tables, shared with the worker processes"""
+
+    state_bits: int
+    end_state: int
+    # per state: (condition terms as (required, excluded) masks, to_state, fired mask)
+    reactions: list[list[tuple[list[tuple[int, int]], int, int]]]
+    # per state: mask of the events its reactions depend on
+    relevant: list[int]
+    # per state: whether none of its reactions depend on the absence of an event
+    monotone: list[bool]
+    # per state: indices of the reactions requiring each event, and of those with a term
+    # requiring no event, so that only reactions which may hold are checked
+    by_event: list[dict[int, list[int]]]
+    unconditional: list[list[int]]
+
+
+def _tables(ir: dict) -> _Tables:
+    num_states = len(ir["states"])
+    reactions = [[] for _ in range(num_states)]
+    relevant = [0] * num_states
+    monotone = [True] * num_states
+    by_event = [{} for _ in range(num_states)]
+    unconditional = [[] for _ in range(num_states)]
+    for reaction, transition in enumerate(ir["do_transition"]):
+        from_state = ir["from_state"][transition]
+        terms = reaction_terms(ir, reaction)
+        fired = 0
+        for event in reaction_fires(ir, reaction):
+            fired |= 1 << event
+
+        index = len(reactions[from_state])
+        reactions[from_state].append((terms, ir["to_state"][transition], fired))
+        required_events = 0
+        for required, excluded in terms:
+            relevant[from_state] |= required | excluded
+            required_events |= required
+            if excluded:
+                monotone[from_state] = False
+            if not required and index not in unconditional[from_state]:
+                unconditional[from_state].append(index)
+        for event in _bits(required_events):
+            by_event[from_state].setdefault(event, []).append(index)
+
+    for state, state_mask in enumerate(relevant):
+        if not monotone[state] and state_mask.bit_count() > MAX_NEGATED_STATE_EVENTS:
+            raise ValueError(
+                f"State '{ir['states'][state]}' reacts to {state_mask.bit_count()} events with "
+                f"negations, at most {MAX_NEGATED_STATE_EVENTS} are supported"
+            )
+
+    return _Tables(
+        state_bits=max(num_states - 1, 1).bit_length(),
+        end_state=ir["end_state"],
+        reactions=reactions,
+        relevant=relevant,
+        monotone=monotone,
+        by_event=by_event,
+        unconditional=unconditional,
+    )
+
+
+def _bits(value: int):
+    """Indices of the set bits of `value`"""
+    while value:
+        low = value & -value
+        yield low.bit_length() - 1
+        value ^= low
+
+
+def _select(tables: _Tables, state: int, current: int) -> int | None:
+    """Index of the first reaction of `state` whose event condition holds for `current`"""
+    reactions = tables.reactions[state]
+    by_event = tables.by_event[state]
+    selected = None
+    candidates = [tables.unconditional[state]]
+    candidates.extend(by_event[event] for event in _bits(current) if event in by_event)
+    for indices in candidates:
+        for index in indices:
+            if selected is not None and index >= selected:
+                break
+            if any(current & req == req and not current & exc for req, exc in reactions[index][0]):
+                selected = index
+                break
+    return selected
+
+
+def _successors(tables: _Tables, config: int) -> list[tuple[int, int]]:
+    """Configurations following `config` in one step, each with a smallest input leading there
+
+    A configuration packs the current state into the low `state_bits` bits and the pending
+    events, i.e. those fired by the previous reaction, into the bits above. Pending events not
+    relevant to the state are dropped, since they are discarded after one step anyway.
+    """
+    state = config & ((1 << tables.state_bits) - 1)
+    if state == tables.end_state:
+        return []
+    pending = config >> tables.state_bits
+    reactions = tables.reactions[state]
+
+    if tables.monotone[state]:
+        # adding events can only enable earlier reactions, hence the smallest input enabling a
+        # term decides whether its reaction can be selected
+        inputs = {0}
+        for terms, _, _ in reactions:
+            for required, _ in terms:
+                inputs.add(required & ~pending)
+    else:
+        relevant = tables.relevant[state]
+        inputs = set()
+        subset = relevant
+        while True:
+            inputs.add(subset)
+            if not subset:
+                break
+            subset = (subset - 1) & relevant
+
+    successors = {}
+    for inputs_mask in sorted(inputs, key=lambda value: (value.bit_count(), value)):
+        selected = _select(tables, state, pending | inputs_mask)
+        if selected is None:
+            next_config = state
+        else:
+            _, to_state, fired = reactions[selected]
+            next_config = to_state | (fired & tables.relevant[to_state]) << tables.state_bits
+        successors.setdefault(next_config, inputs_mask)
+    return list(successors.items())
+
+
+_worker_tables = None
+
+
+def _init_worker(tables: _Tables):
+    global _worker_tables
+    _worker_tables = tables
+
+
+def _expand_chunk(configs: list[int]) -> list[list[tuple[int, int]]]:
+    return [_successors(_worker_tables, config) for config in configs]
+
+
+def explore_ir(ir: dict, workers: int | None = None) -> ExplorationReport:
+    """Explores all configurations of the FSM IR reachable under arbitrary event inputs
+
+    In each step any set of events may be produced as input, in addition to the events fired
+    by the reaction of the previous step, and the first reaction of the current state whose
+    event condition holds is taken, as in `fsm_step`. Configurations are explored in BFS order,
+    with the expansion of large BFS levels split across `workers` processes if given.
+
+    The report contains the reachable and unreachable states, the deadlock states from which
+    no reaction can ever fire, the trap states with configurations from which the end state
+    cannot be reached, and the shortest input sequence to each reachable state.
+
+    A configuration keeps only the pending events relevant to its state. The BFS parent of
+    each configuration is stored for the input sequences, and its other predecessors for
+    finding the configurations from which the end state can be reached, so that memory stays
+    linear in the number of distinct configurations and of the steps between them.
+    """
+    tables = _tables(ir)
+    start = ir["start_state"]
+
+    # each configuration maps to its BFS parent and the input leading from there
+    parents = {start: None}
+    # configurations stepping to each configuration, other than itself, for the trap states
+    predecessors = {}
+    level = [start]
+
+    executor = None
+    if workers is not None and workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(tables,))
+    try:
+        while level:
+            if executor is not None and len(level) >= _MIN_PARALLEL_LEVEL:
+                size = -(-len(level) // workers)
+                chunks = [level[i : i + size] for i in range(0, len(level), size)]
+                expanded = [
+                    successors
+                    for chunk in executor.map(_expand_chunk, chunks)
+                    for successors in chunk
+                ]
+            else:
+                expanded = [_successors(tables, config) for config in level]
+
+            next_level = []
+            for config, successors in zip(level, expanded):
+                for next_config, inputs_mask in successors:
+                    if next_config != config:
+                        predecessors.setdefault(next_config, []).append(config)
+                    if next_config not in parents:
+                        parents[next_config] = (config, inputs_mask)
+                        next_level.append(next_config)
+            level = next_level
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    state_mask = (1 << tables.state_bits) - 1
+
+    # configurations from which the end state can be reached
+    reaches_end = {config for config in parents if config & state_mask == tables.end_state}
+    queue = deque(reaches_end)
+    while queue:
+        for pred in predecessors.get(queue.popleft(), ()):
+            if pred not in reaches_end:
+                reaches_end.add(pred)
+                queue.append(pred)
+
+    # the first configuration of a state in BFS order has the shortest input sequence
+    first_configs = {}
+    trap_states = set()
+    for config in parents:
+        state = ir["states"][config & state_mask]
+        first_configs.setdefault(state, config)
+        if config not in reaches_end:
+            trap_states.add(state)
+
+    # with arbitrary inputs, some reaction can fire unless all event conditions are unsatisfiable
+    deadlock_states = [
+        state
+        for index, state in enumerate(ir["states"])
+        if state in first_configs
+        and index != tables.end_state
+        and not any(
+            not required & excluded
+            for terms, _, _ in tables.reactions[index]
+            for required, excluded in terms
+        )
+    ]
+
+    return ExplorationReport(
+        num_configurations=len(parents),
+        reachable_states=[state for state in ir["states"] if state in first_configs],
+        unreachable_states=[state for state in ir["states"] if state not in first_configs],
+        deadlock_states=deadlock_states,
+        trap_states=[state for state in ir["states"] if state in trap_states],
+        end_reachable=ir["states"][ir["end_state"]] in first_configs,
+        events=ir["events"],
+        _parents=parents,
+        _first_configs=first_configs,
+    )
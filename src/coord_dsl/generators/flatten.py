@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: MPL-2.0
+from dataclasses import dataclass, field
+from typing import Optional
+from coord_dsl.generators.classes import FSM, ConditionTerm, Event, Reaction, State, Transition
+
+# separator between the names of a composite state and of the elements of its sub-FSM
+SEPARATOR = "__"
+
+
+@dataclass
+class FlatState:
+    name: str
+    uri: str
+    source: State
+
+
+@dataclass
+class FlatTransition:
+    name: str
+    uri: str
+    from_state: FlatState
+    to_state: FlatState
+    source: Transition
+
+
+@dataclass
+class FlatReaction:
+    name: str
+    uri: str
+    do: FlatTransition
+    source: Reaction
+
+    @property
+    def condition_terms(self) -> list[ConditionTerm]:
+        return self.source.condition_terms
+
+    @property
+    def when_event(self) -> Optional[Event]:
+        return self.source.when_event
+
+    @property
+    def fired_events(self) -> list[Event]:
+        return self.source.fired_events
+
+
+@dataclass
+class FlatFSM:
+    """FSM with the composite states replaced by the leaf states of their sub-FSMs"""
+
+    states: list[FlatState] = field(default_factory=list)
+    start_state: Optional[FlatState] = None
+    end_state: Optional[FlatState] = None
+    transitions: list[FlatTransition] = field(default_factory=list)
+    reactions: list[FlatReaction] = field(default_factory=list)
+
+
+def fsm_containers(fsm: FSM) -> list[tuple[FSM | State, str]]:
+    """The FSM and its composite states with the prefix of their elements, innermost first"""
+    containers = []
+
+    def collect(container, prefix):
+        for state in container.states:
+            if state.is_composite:
+                collect(state, prefix + state.name + SEPARATOR)
+        containers.append((container, prefix))
+
+    collect(fsm, "")
+    return containers
+
+
+def flatten_fsm(fsm: FSM) -> FlatFSM:
+    """Flattens the composite states of an FSM into a single set of states and tables
+
+    Leaf states of a sub-FSM are named after their composite states, e.g. `C__S` for state `S`
+    of composite state `C`, and so are the transitions & reactions of the sub-FSM. Entering a
+    composite state enters the start state of its sub-FSM, recursively. A transition from a
+    composite state is expanded into one transition from each of its leaf states, named after
+    the leaf state relative to the sub-FSM declaring the transition, e.g. `T__C__S`, and so are
+    the reactions doing it.
+
+    Reactions of a sub-FSM are ordered before those of the enclosing FSMs, so that reactions of
+    inner states take priority when both hold. Models without composite states keep their
+    names & order, hence flattening does not change them.
+    """
+    flat = FlatFSM()
+    # leaf states of each state, and the leaf state entered when entering it
+    leaves: dict[int, list[FlatState]] = {}
+    initial: dict[int, FlatState] = {}
+
+    def add_states(states: list[State], prefix: str):
+        for state in states:
+            name = prefix + state.name
+            if state.is_composite:
+                add_states(state.states, name + SEPARATOR)
+                leaves[id(state)] = [leaf for sub in state.states for leaf in leaves[id(sub)]]
+                initial[id(state)] = initial[id(state.start_state)]
+            else:
+                leaf = FlatState(name, fsm.namespace[name], state)
+                flat.states.append(leaf)
+                leaves[id(state)] = [leaf]
+                initial[id(state)] = leaf
+
+    add_states(fsm.states, "")
+    flat.start_state = initial[id(fsm.start_state)]
+    flat.end_state = initial[id(fsm.end_state)]
+
+    containers = fsm_containers(fsm)
+
+    # flat transitions of each transition, with the suffix naming their leaf state if expanded
+    expanded: dict[int, list[tuple[str, FlatTransition]]] = {}
+    for container, prefix in containers:
+        for transition in container.transitions:
+            to_state = initial[id(transition.to_state)]
+            transitions = []
+            for leaf in leaves[id(transition.from_state)]:
+                suffix = ""
+                if transition.from_state.is_composite:
+                    # leaf states are named relative to the sub-FSM declaring the transition
+                    suffix = SEPARATOR + leaf.name.removeprefix(prefix)
+                name = prefix + transition.name + suffix
+                flat_transition = FlatTransition(
+                    name, fsm.namespace[name], leaf, to_state, transition
+                )
+                flat.transitions.append(flat_transition)
+                transitions.append((suffix, flat_transition))
+            expanded[id(transition)] = transitions
+
+    for container, prefix in containers:
+        for reaction in container.reactions:
+            for suffix, transition in expanded[id(reaction.do)]:
+                name = prefix + reaction.name + suffix
+                flat.reactions.append(FlatReaction(name, fsm.namespace[name], transition, reaction))
+
+    return flat
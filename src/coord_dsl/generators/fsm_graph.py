@@ -1,17 +1,60 @@
 import json
+import keyword
+import logging
 from typing import List
 from dataclasses import dataclass, field
 from textx import generator
 from jinja2 import Environment, FileSystemLoader
 from pathlib import Path
-from rdflib import Graph, Namespace, Literal, RDF, XSD, URIRef
+from rdflib import BNode, Graph, Namespace, Literal, RDF, XSD, URIRef
 from rdf_utils.uri import URL_SECORO_MM
 from coord_dsl.generators.classes import *
+from coord_dsl.generators.flatten import flatten_fsm
+
+logger = logging.getLogger(__name__)
+
+# globals of the fast-import module and the builtins it uses, which IDs must not shadow
+FAST_IMPORT_RESERVED = frozenset(
+    {
+        "EventData",
+        "FSMData",
+        "Transition",
+        "EventReaction",
+        "StateHooks",
+        "NUM_EVENTS",
+        "NUM_STATES",
+        "EVENT_NAMES",
+        "STATE_NAMES",
+        "TRANSITION_NAMES",
+        "REACTION_NAMES",
+        "MERGED_STATES",
+        "TRANSITIONS",
+        "REACTIONS",
+        "EventID",
+        "StateID",
+        "TransitionID",
+        "ReactionID",
+        "create_fsm",
+        "_ENUM_NAMES",
+        "_tables",
+        "_get_tables",
+        "AttributeError",
+        "dict",
+        "enumerate",
+        "globals",
+        "int",
+        "list",
+        "range",
+        "tuple",
+    }
+)
 
 
 def get_fsm_graph(model) -> tuple[Graph, dict]:
     fsm: FSM = getattr(model, "fsm", None)
     assert fsm is not None, "Model does not contain an FSM definition"
+    # composite states are flattened, so that the graph holds the runtime tables
+    flat = flatten_fsm(fsm)
 
     URI_MM_FSM = f"{URL_SECORO_MM}/behaviour/fsm#"
     URI_MM_EL  = f"{URL_SECORO_MM}/behaviour/event_loop#"
@@ -23,7 +66,7 @@ def get_fsm_graph(model) -> tuple[Graph, dict]:
     g.bind("fsm", NS_FSM)
     g.bind("el", NS_EL)
 
-    print(f"FSM: {fsm.name}, URI: {fsm.uri}")
+    logger.info("FSM: %s, URI: %s", fsm.name, fsm.uri)
 
     NS_MODEL = Namespace(fsm.namespace)
     URI_MODEL = fsm.uri
@@ -34,11 +77,11 @@ def get_fsm_graph(model) -> tuple[Graph, dict]:
     if fsm.description is not None:
         g.add((URI_MODEL, NS_FSM.description, Literal(fsm.description)))
 
-    g.add((URI_MODEL, NS_FSM["start-state"], URIRef(fsm.start_state.uri)))
-    g.add((URI_MODEL, NS_FSM["end-state"], URIRef(fsm.end_state.uri)))
-    g.add((URI_MODEL, NS_FSM["current-state"], URIRef(fsm.start_state.uri)))
+    g.add((URI_MODEL, NS_FSM["start-state"], URIRef(flat.start_state.uri)))
+    g.add((URI_MODEL, NS_FSM["end-state"], URIRef(flat.end_state.uri)))
+    g.add((URI_MODEL, NS_FSM["current-state"], URIRef(flat.start_state.uri)))
 
-    for state in fsm.states:
+    for state in flat.states:
         g.add((URIRef(state.uri), RDF.type, NS_FSM.State))
         g.add((URI_MODEL, NS_FSM.states, URIRef(state.uri)))
 
@@ -46,7 +89,7 @@ def get_fsm_graph(model) -> tuple[Graph, dict]:
         g.add((URIRef(event.uri), RDF.type, NS_EL.Event))
         g.add((URI_MODEL, NS_FSM.events, URIRef(event.uri)))
 
-    for transition in fsm.transitions:
+    for transition in flat.transitions:
         g.add((URIRef(transition.uri), RDF.type, NS_FSM.Transition))
         g.add((URI_MODEL, NS_FSM.transitions, URIRef(transition.uri)))
 
@@ -56,15 +99,26 @@ def get_fsm_graph(model) -> tuple[Graph, dict]:
         g.add((URIRef(transition.uri), NS_FSM["transition-from"], URIRef(from_state)))
         g.add((URIRef(transition.uri), NS_FSM["transition-to"], URIRef(to_state)))
 
-    for reaction in fsm.reactions:
+    for reaction in flat.reactions:
         g.add((URIRef(reaction.uri), RDF.type, NS_FSM.Reaction))
         g.add((URI_MODEL, NS_FSM.reactions, URIRef(reaction.uri)))
 
-        when = reaction.when.uri
+        when_event = reaction.when_event
         do = reaction.do.uri
-        fires = [f.event.uri for f in reaction.fires if f.event is not None]
-
-        g.add((URIRef(reaction.uri), NS_FSM["when-event"], URIRef(when)))
+        fires = [event.uri for event in reaction.fired_events]
+
+        if when_event is not None:
+            g.add((URIRef(reaction.uri), NS_FSM["when-event"], URIRef(when_event.uri)))
+        else:
+            # event composition, as a disjunction of event conjunctions
+            for requires, excludes in reaction.condition_terms:
+                term = BNode()
+                g.add((term, RDF.type, NS_FSM.EventConjunction))
+                g.add((URIRef(reaction.uri), NS_FSM["when-conjunction"], term))
+                for event in requires:
+                    g.add((term, NS_FSM["requires-event"], URIRef(event.uri)))
+                for event in excludes:
+                    g.add((term, NS_FSM["excludes-event"], URIRef(event.uri)))
         g.add((URIRef(reaction.uri), NS_FSM["do-transition"], URIRef(do)))
         for event_uri in fires:
             g.add((URIRef(reaction.uri), NS_FSM["fires-events"], URIRef(event_uri)))
@@ -86,6 +140,18 @@ def uri_str(node) -> str:
     return str(node)
 
 def gen_json(g: Graph) -> dict:
+    """Builds the IR of the FSM in the graph, with elements referring to each other by index
+
+    States, events, transitions and reactions are assigned dense indices in the order of their
+    triples, and their names are listed in `states`, `events`, `transitions` & `reactions`.
+    The tables are columnar arrays of indices:
+    - `from_state[t]`, `to_state[t]`: start & end states of transition `t`
+    - `when_event[r]`: event of reaction `r`, or -1 if conditioned on an event composition
+    - `do_transition[r]`: transition of reaction `r`
+    - `fires_events[fires_offsets[r]:fires_offsets[r + 1]]`: events fired by reaction `r`
+    - `term_requires[k]`, `term_excludes[k]` for `k` in `term_offsets[r]:term_offsets[r + 1]`:
+      event condition of reaction `r` as a disjunction of (required, excluded) event bitmasks
+    """
     URI_MM_FSM = f"{URL_SECORO_MM}/behaviour/fsm#"
     NS_FSM = Namespace(URI_MM_FSM)
 
@@ -96,61 +162,147 @@ def gen_json(g: Graph) -> dict:
     description_node = g.value(fsm_ref, NS_FSM.description)
     description = str(description_node) if description_node is not None else None
 
-    start_state = local_name(uri_str(g.value(fsm_ref, NS_FSM["start-state"])))
-    end_state   = local_name(uri_str(g.value(fsm_ref, NS_FSM["end-state"])))
-
-    states = []
-    for _, _, state_uri in g.triples((fsm_ref, NS_FSM.states, None)):
-        states.append(local_name(uri_str(state_uri)))
-
-    events = []
-    for _, _, event_uri in g.triples((fsm_ref, NS_FSM.events, None)):
-        events.append(local_name(uri_str(event_uri)))
-
-    transitions_table = []
-    for _, _, tr_uri in g.triples((fsm_ref, NS_FSM.transitions, None)):
-        from_state = local_name(uri_str(g.value(tr_uri, NS_FSM["transition-from"])))
-        to_state   = local_name(uri_str(g.value(tr_uri, NS_FSM["transition-to"])))
-        transitions_table.append({
-            "id":         local_name(uri_str(tr_uri)),
-            "from_state": from_state,
-            "to_state":   to_state,
-        })
-
-    reactions_table = []
-    for _, _, rx_uri in g.triples((fsm_ref, NS_FSM.reactions, None)):
-        when_event    = local_name(uri_str(g.value(rx_uri, NS_FSM["when-event"])))
-        do_transition = local_name(uri_str(g.value(rx_uri, NS_FSM["do-transition"])))
-        fires = [
-            local_name(uri_str(ev_uri))
-            for _, _, ev_uri in g.triples((rx_uri, NS_FSM["fires-events"], None))
-        ]
-        reactions_table.append({
-            "id":            local_name(uri_str(rx_uri)),
-            "when_event":    when_event,
-            "do_transition": do_transition,
-            "fires_events":  fires,
-            "num_fires":     len(fires),
-        })
+    # names are resolved once per element, and references are looked up by node
+    def index_elements(predicate) -> tuple[list[str], dict]:
+        names = []
+        indices = {}
+        for _, _, node in g.triples((fsm_ref, predicate, None)):
+            indices[node] = len(names)
+            names.append(local_name(uri_str(node)))
+        return names, indices
+
+    states, state_indices = index_elements(NS_FSM.states)
+    events, event_indices = index_elements(NS_FSM.events)
+    transitions, transition_indices = index_elements(NS_FSM.transitions)
+
+    from_state = [0] * len(transitions)
+    to_state = [0] * len(transitions)
+    for tr_node, index in transition_indices.items():
+        from_state[index] = state_indices[g.value(tr_node, NS_FSM["transition-from"])]
+        to_state[index] = state_indices[g.value(tr_node, NS_FSM["transition-to"])]
+
+    def events_mask(node, predicate) -> int:
+        mask = 0
+        for _, _, ev_node in g.triples((node, predicate, None)):
+            mask |= 1 << event_indices[ev_node]
+        return mask
+
+    reactions = []
+    when_event = []
+    do_transition = []
+    fires_offsets = [0]
+    fires_events = []
+    term_offsets = [0]
+    term_requires = []
+    term_excludes = []
+    for _, _, rx_node in g.triples((fsm_ref, NS_FSM.reactions, None)):
+        reactions.append(local_name(uri_str(rx_node)))
+
+        when_node = g.value(rx_node, NS_FSM["when-event"])
+        if when_node is not None:
+            event = event_indices[when_node]
+            when_event.append(event)
+            term_requires.append(1 << event)
+            term_excludes.append(0)
+        else:
+            when_event.append(-1)
+            for _, _, term in g.triples((rx_node, NS_FSM["when-conjunction"], None)):
+                term_requires.append(events_mask(term, NS_FSM["requires-event"]))
+                term_excludes.append(events_mask(term, NS_FSM["excludes-event"]))
+        term_offsets.append(len(term_requires))
+
+        do_transition.append(transition_indices[g.value(rx_node, NS_FSM["do-transition"])])
+        for _, _, ev_node in g.triples((rx_node, NS_FSM["fires-events"], None)):
+            fires_events.append(event_indices[ev_node])
+        fires_offsets.append(len(fires_events))
 
     result = {
         "name":        name,
         "description": description,
-        "start_state": start_state,
-        "end_state":   end_state,
+        "start_state": state_indices[g.value(fsm_ref, NS_FSM["start-state"])],
+        "end_state":   state_indices[g.value(fsm_ref, NS_FSM["end-state"])],
         "states":      states,
         "events":      events,
-        "transitions_table": transitions_table,
-        "reactions_table":   reactions_table,
+        "transitions": transitions,
+        "reactions":   reactions,
+        "from_state":    from_state,
+        "to_state":      to_state,
+        "when_event":    when_event,
+        "do_transition": do_transition,
+        "fires_offsets": fires_offsets,
+        "fires_events":  fires_events,
+        "term_offsets":  term_offsets,
+        "term_requires": term_requires,
+        "term_excludes": term_excludes,
     }
 
     return result
 
 
-def gen_cpp_header(ir: dict):
-    """Generates a .hpp file with the FSM datastructures"""
+def mask_events(mask: int) -> list[int]:
+    """Indices of the events in an event bitmask"""
+    return [index for index in range(mask.bit_length()) if mask >> index & 1]
+
+
+def reaction_terms(ir: dict, reaction: int) -> list[tuple[int, int]]:
+    """Event condition of a reaction as (required, excluded) event bitmasks"""
+    start, end = ir["term_offsets"][reaction], ir["term_offsets"][reaction + 1]
+    return list(zip(ir["term_requires"][start:end], ir["term_excludes"][start:end]))
+
+
+def reaction_fires(ir: dict, reaction: int) -> list[int]:
+    """Events fired by a reaction"""
+    return ir["fires_events"][ir["fires_offsets"][reaction] : ir["fires_offsets"][reaction + 1]]
+
+
+def get_state_reactions(ir: dict) -> list[list[int]]:
+    """Reactions grouped by the start state of their transitions, indexed by state
+
+    Reactions keep their order from the reaction table, i.e. their priority.
+    """
+    state_reactions = [[] for _ in ir["states"]]
+    for reaction, transition in enumerate(ir["do_transition"]):
+        state_reactions[ir["from_state"][transition]].append(reaction)
+
+    return state_reactions
 
-    print(f"Generating C code for FSM: {ir['name']}")
+
+def check_shared_names(ir: dict, target: str):
+    """Raises a ValueError if a name is used by several states, events, transitions or reactions
+
+    Needed for targets whose IDs share a namespace, e.g. the enumerators of the C++ header.
+    """
+    seen = set()
+    for kind in ("states", "events", "transitions", "reactions"):
+        for name in ir[kind]:
+            if name in seen:
+                raise ValueError(
+                    f"Name '{name}' of FSM '{ir['name']}' is used by several elements, "
+                    f"which is not supported with {target}"
+                )
+            seen.add(name)
+
+
+def gen_cpp_header(ir: dict, specialize: bool = False):
+    """Generates a .hpp file with the FSM datastructures
+
+    If `specialize` is set, a step function specific to the model is also generated, which
+    switches on the current state and only checks reactions starting in that state.
+    Reactions conditioned on event compositions are only supported by the specialized step
+    function, in which case the data structures for coord2b's `fsm_step_nbx` are omitted.
+    Since the ID enums are unscoped, names must be unique across states, events, transitions
+    and reactions.
+    """
+
+    logger.info("Generating C code for FSM: %s", ir["name"])
+    check_shared_names(ir, "the C++ header, whose ID enums share a namespace")
+
+    generic = all(event >= 0 for event in ir["when_event"])
+    if not generic and not specialize:
+        raise ValueError(
+            f"FSM '{ir['name']}' has reactions on event compositions, which require the "
+            "specialized step function ('--specialize')"
+        )
 
     # get module path
     module_path = Path(__file__).parent.parent
@@ -160,26 +312,51 @@ def gen_cpp_header(ir: dict):
     output = template.render(
         {
             "data": ir,
+            "generic": generic,
+            "specialize": specialize,
+            "state_reactions": get_state_reactions(ir) if specialize else [],
+            "event_names": lambda mask: [ir["events"][event] for event in mask_events(mask)],
         }
     )
 
     return output
 
-def gen_python_code(ir: dict):
-    """Generates a .py file with the FSM datastructures"""
-
-    print(f"Generating Python code for FSM: {ir['name']}")
+def gen_python_code(ir: dict, fast_import: bool = False):
+    """Generates a .py file with the FSM datastructures
+
+    If `fast_import` is set, IDs are generated as integer constants and the tables as tuple
+    literals, and the ID enums are only created when first accessed, so that importing the
+    module and creating instances is fast for large models. Since the constants share the
+    module namespace, names must then be unique across states, events, transitions and
+    reactions, and must not be one of the module's own globals, see `FAST_IMPORT_RESERVED`.
+    """
+
+    logger.info("Generating Python code for FSM: %s", ir["name"])
+
+    if fast_import:
+        check_shared_names(ir, "fast import ('--fastimport')")
+        for kind in ("states", "events", "transitions", "reactions"):
+            for name in ir[kind]:
+                if (
+                    name in FAST_IMPORT_RESERVED
+                    or keyword.iskeyword(name)
+                    or name.startswith("__")
+                ):
+                    raise ValueError(
+                        f"Name '{name}' of FSM '{ir['name']}' is reserved by the generated "
+                        "module with fast import ('--fastimport')"
+                    )
 
     # get module path
     module_path = Path(__file__).parent.parent
     env = Environment(loader=FileSystemLoader(module_path / "templates"))
-    template = env.get_template("fsm.py.jinja2")
+    template = env.get_template("fsm_fast.py.jinja2" if fast_import else "fsm.py.jinja2")
 
     output = template.render(
         {
             "data": ir,
+            "event_names": lambda mask: [ir["events"][event] for event in mask_events(mask)],
         }
     )
 
     return output
-
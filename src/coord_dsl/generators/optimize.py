@@ -0,0 +1,344 @@
+# SPDX-License-Identifier: MPL-2.0
+from collections import deque
+from dataclasses import dataclass, field
+from coord_dsl.generators.fsm_graph import mask_events, reaction_fires, reaction_terms
+
+
+@dataclass
+class PruneReport:
+    """Elements removed by `prune_ir`, mapped to the reason for their removal"""
+
+    states: dict[str, str] = field(default_factory=dict)
+    events: dict[str, str] = field(default_factory=dict)
+    transitions: dict[str, str] = field(default_factory=dict)
+    reactions: dict[str, str] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        lines = []
+        for kind in ("states", "events", "transitions", "reactions"):
+            for name, reason in getattr(self, kind).items():
+                lines.append(f"  {kind[:-1]} '{name}': {reason}")
+
+        if not lines:
+            return "Pruning: nothing to remove"
+        return "\n".join([f"Pruning: removed {len(lines)} element(s)"] + lines)
+
+
+def _condition_terms(ir: dict, reaction: int) -> frozenset[tuple[int, int]]:
+    """The reaction's event condition as a set of (required, excluded) event bitmasks"""
+    return frozenset(reaction_terms(ir, reaction))
+
+
+def _remap_mask(mask: int, event_index: dict[int, int]) -> int:
+    remapped = 0
+    for event in mask_events(mask):
+        remapped |= 1 << event_index[event]
+    return remapped
+
+
+def _select_ir(
+    ir: dict,
+    states: list[int],
+    events: list[int],
+    transitions: list[int],
+    reactions: list[int],
+    state_index: dict[int, int] | None = None,
+) -> dict:
+    """IR with the given elements of `ir`, in the given order, re-indexed
+
+    `state_index` maps the states of `ir` to their new indices, by default their position in
+    `states`. Only the given transitions & reactions may refer to states or events not kept.
+    """
+    if state_index is None:
+        state_index = {state: index for index, state in enumerate(states)}
+    event_index = {event: index for index, event in enumerate(events)}
+    transition_index = {transition: index for index, transition in enumerate(transitions)}
+    same_events = len(events) == len(ir["events"])
+
+    def remap(mask: int) -> int:
+        return mask if same_events else _remap_mask(mask, event_index)
+
+    fires_offsets = [0]
+    fires_events = []
+    term_offsets = [0]
+    term_requires = []
+    term_excludes = []
+    for reaction in reactions:
+        fires_events.extend(event_index[event] for event in reaction_fires(ir, reaction))
+        fires_offsets.append(len(fires_events))
+        for required, excluded in reaction_terms(ir, reaction):
+            term_requires.append(remap(required))
+            term_excludes.append(remap(excluded))
+        term_offsets.append(len(term_requires))
+
+    result = dict(ir)
+    result.update(
+        {
+            "start_state": state_index[ir["start_state"]],
+            "end_state": state_index[ir["end_state"]],
+            "states": [ir["states"][state] for state in states],
+            "events": [ir["events"][event] for event in events],
+            "transitions": [ir["transitions"][transition] for transition in transitions],
+            "reactions": [ir["reactions"][reaction] for reaction in reactions],
+            "from_state": [state_index[ir["from_state"][tr]] for tr in transitions],
+            "to_state": [state_index[ir["to_state"][tr]] for tr in transitions],
+            "when_event": [
+                event_index[ir["when_event"][reaction]] if ir["when_event"][reaction] >= 0 else -1
+                for reaction in reactions
+            ],
+            "do_transition": [
+                transition_index[ir["do_transition"][reaction]] for reaction in reactions
+            ],
+            "fires_offsets": fires_offsets,
+            "fires_events": fires_events,
+            "term_offsets": term_offsets,
+            "term_requires": term_requires,
+            "term_excludes": term_excludes,
+        }
+    )
+    return result
+
+
+def prune_ir(ir: dict, keep_indices: bool = False) -> tuple[dict, PruneReport]:
+    """Removes elements of the FSM IR that can never take effect in `fsm_step`
+
+    The following are removed:
+    - reactions whose transition starts in the end state, since stepping stops there
+    - reactions shadowed by earlier reactions with the same start state, i.e. whenever their
+      event condition holds so does an earlier one, since only the first matching reaction
+      is handled
+    - reactions with event conditions that can never be satisfied
+    - transitions not used by any remaining reaction
+    - states not reachable from the start state, and the transitions & reactions starting there
+    - events neither conditioning nor fired by any remaining reaction
+
+    Whether an event is produced by user behaviours cannot be known from the model, hence any
+    event with a reaction is assumed to occur eventually.
+
+    If `keep_indices` is set, the states and events are left untouched so that their indices
+    stay the same as in the unpruned model, and only transitions and reactions are removed.
+    """
+    report = PruneReport()
+    end_state = ir["end_state"]
+    from_state = ir["from_state"]
+    num_states = len(ir["states"])
+
+    # reactions that can never be selected
+    reactions = []
+    handled_events = [0] * num_states
+    handled_terms = [[] for _ in range(num_states)]
+    for reaction, transition in enumerate(ir["do_transition"]):
+        state = from_state[transition]
+        name = ir["reactions"][reaction]
+        if state == end_state:
+            report.reactions[name] = "transition starts in the end state"
+            continue
+
+        terms = _condition_terms(ir, reaction)
+        if not terms:
+            report.reactions[name] = "event condition can never be satisfied"
+            continue
+
+        # a term is shadowed if an earlier term only requires a subset of its events
+        if all(
+            requires & handled_events[state]
+            or any(
+                not other_requires & ~requires and not other_excludes & ~excludes
+                for other_requires, other_excludes in handled_terms[state]
+            )
+            for requires, excludes in terms
+        ):
+            report.reactions[name] = "shadowed by earlier reactions"
+            continue
+
+        for requires, excludes in terms:
+            if requires.bit_count() == 1 and not excludes:
+                handled_events[state] |= requires
+            else:
+                handled_terms[state].append((requires, excludes))
+        reactions.append(reaction)
+
+    # reachability over the transitions which can still be taken
+    used_transitions = {ir["do_transition"][reaction] for reaction in reactions}
+    successors = [[] for _ in range(num_states)]
+    for transition in used_transitions:
+        successors[from_state[transition]].append(ir["to_state"][transition])
+
+    reachable = {ir["start_state"]}
+    queue = deque(reachable)
+    while queue:
+        for next_state in successors[queue.popleft()]:
+            if next_state not in reachable:
+                reachable.add(next_state)
+                queue.append(next_state)
+
+    transitions = []
+    for transition, name in enumerate(ir["transitions"]):
+        if transition not in used_transitions:
+            report.transitions[name] = "not used by any reaction"
+        elif from_state[transition] not in reachable:
+            report.transitions[name] = "starts in an unreachable state"
+        else:
+            transitions.append(transition)
+
+    kept_transitions = set(transitions)
+    kept_reactions = []
+    for reaction in reactions:
+        if ir["do_transition"][reaction] not in kept_transitions:
+            name = ir["reactions"][reaction]
+            report.reactions[name] = "transition starts in an unreachable state"
+        else:
+            kept_reactions.append(reaction)
+
+    states = list(range(num_states))
+    events = list(range(len(ir["events"])))
+    if not keep_indices:
+        # the start & end states are always needed by the runtime
+        reachable.add(end_state)
+        states = [state for state in states if state in reachable]
+        for state, name in enumerate(ir["states"]):
+            if state not in reachable:
+                report.states[name] = "not reachable from the start state"
+
+        used_events = 0
+        for reaction in kept_reactions:
+            for requires, excludes in reaction_terms(ir, reaction):
+                used_events |= requires | excludes
+            for event in reaction_fires(ir, reaction):
+                used_events |= 1 << event
+        events = mask_events(used_events)
+        for event, name in enumerate(ir["events"]):
+            if not used_events >> event & 1:
+                report.events[name] = "not used by any reaction"
+
+    return _select_ir(ir, states, events, transitions, kept_reactions), report
+
+
+def _state_signatures(ir: dict) -> tuple[list[tuple], list[dict]]:
+    """Observable reaction structure of each state
+
+    Returns the signature of each state, i.e. the ordered event conditions it reacts to and
+    the events fired in response, and for each state the target state per event condition.
+    """
+    num_states = len(ir["states"])
+    signatures = [[] for _ in range(num_states)]
+    targets = [{} for _ in range(num_states)]
+    for reaction, transition in enumerate(ir["do_transition"]):
+        state = ir["from_state"][transition]
+        condition = _condition_terms(ir, reaction)
+        if condition in targets[state]:
+            # shadowed by an earlier reaction
+            continue
+
+        targets[state][condition] = ir["to_state"][transition]
+        signatures[state].append((condition, tuple(reaction_fires(ir, reaction))))
+
+    # no reaction is handled once the end state is reached
+    signatures = [tuple(signature) for signature in signatures]
+    signatures[ir["end_state"]] = ("end",)
+    targets[ir["end_state"]] = {}
+    return signatures, targets
+
+
+def _hopcroft(blocks: list[set], targets: list[dict]) -> list[set]:
+    """Refines the initial partition `blocks` into the coarsest partition stable under `targets`"""
+    predecessors = {}
+    for state, state_targets in enumerate(targets):
+        for event, target in state_targets.items():
+            predecessors.setdefault(event, {}).setdefault(target, []).append(state)
+
+    block_of = {}
+    for index, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = index
+
+    # all blocks but the largest one are initial splitters
+    largest = max(range(len(blocks)), key=lambda index: len(blocks[index]))
+    worklist = {(index, event) for index in range(len(blocks)) for event in predecessors}
+    worklist -= {(largest, event) for event in predecessors}
+
+    while worklist:
+        splitter, event = worklist.pop()
+        event_predecessors = predecessors[event]
+
+        # states leading into the splitter block on the event, grouped by their block
+        touched = {}
+        for state in blocks[splitter]:
+            for pred in event_predecessors.get(state, ()):
+                touched.setdefault(block_of[pred], set()).add(pred)
+
+        for index, inside in touched.items():
+            if len(inside) == len(blocks[index]):
+                continue
+
+            outside = blocks[index] - inside
+            blocks[index] = inside
+            new_index = len(blocks)
+            blocks.append(outside)
+            for state in outside:
+                block_of[state] = new_index
+
+            for split_event in predecessors:
+                if (index, split_event) in worklist:
+                    worklist.add((new_index, split_event))
+                elif len(inside) <= len(outside):
+                    worklist.add((index, split_event))
+                else:
+                    worklist.add((new_index, split_event))
+
+    return blocks
+
+
+def minimize_ir(ir: dict) -> dict:
+    """Merges behaviourally equivalent states of the FSM IR using Hopcroft's algorithm
+
+    Two states are equivalent if they react to the same event conditions in the same priority
+    order, fire the same events in response and transition to equivalent states. Each group of
+    equivalent states is represented by its first state in the original order; transitions
+    and reactions from the other states of a group are removed.
+
+    The result contains the names of the states before minimization in `original_states`, and
+    in `state_map` the index of the merged state of each of them.
+    """
+    signatures, targets = _state_signatures(ir)
+    num_states = len(ir["states"])
+
+    initial = {}
+    for state in range(num_states):
+        initial.setdefault(signatures[state], set()).add(state)
+    blocks = _hopcroft(list(initial.values()), targets)
+
+    block_of = [0] * num_states
+    for index, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = index
+
+    states = []
+    state_index = {}
+    block_index = {}
+    for state in range(num_states):
+        block = block_of[state]
+        if block not in block_index:
+            block_index[block] = len(states)
+            states.append(state)
+        state_index[state] = block_index[block]
+
+    representatives = set(states)
+    transitions = [
+        transition
+        for transition, from_state in enumerate(ir["from_state"])
+        if from_state in representatives
+    ]
+    kept_transitions = set(transitions)
+    reactions = [
+        reaction
+        for reaction, transition in enumerate(ir["do_transition"])
+        if transition in kept_transitions
+    ]
+
+    result = _select_ir(
+        ir, states, list(range(len(ir["events"]))), transitions, reactions, state_index
+    )
+    result["original_states"] = ir["states"]
+    result["state_map"] = [state_index[state] for state in range(num_states)]
+    return result
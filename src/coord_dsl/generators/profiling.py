@@ -0,0 +1,190 @@
+# SPDX-License-Identifier: MPL-2.0
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+
+@dataclass
+class StageProfile:
+    """Wall time, traced memory and element counts of one stage of a generator run"""
+
+    name: str
+    seconds: float = 0.0
+    # net change of the traced memory, and its peak above the traced memory at the stage start
+    allocated_bytes: int = 0
+    peak_bytes: int = 0
+    counts: dict[str, int] = field(default_factory=dict)
+
+
+class PipelineProfiler:
+    """Records the stages of a generator run, e.g. parsing, building the graph or rendering
+
+    Stages are timed with `time.perf_counter` and their allocations are traced with
+    `tracemalloc`, which is started by the profiler if not already running. Tracing slows
+    down allocations, so the times are only comparable between profiled runs.
+
+    A disabled profiler records nothing, so that generators use the same code path with and
+    without profiling.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages: list[StageProfile] = []
+        self._current: StageProfile | None = None
+        self._start = 0.0
+        self._start_memory = 0
+        self._started_tracing = False
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def start(self, name: str) -> StageProfile:
+        """Starts a stage, ending the current one if any"""
+        if self._current is not None:
+            self.stop()
+        profile = StageProfile(name)
+        if not self.enabled:
+            return profile
+
+        self._current = profile
+        tracemalloc.reset_peak()
+        self._start_memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return profile
+
+    def stop(self) -> StageProfile | None:
+        """Ends the current stage, returning it"""
+        profile = self._current
+        if profile is None:
+            return None
+
+        profile.seconds = time.perf_counter() - self._start
+        memory, peak = tracemalloc.get_traced_memory()
+        profile.allocated_bytes = memory - self._start_memory
+        profile.peak_bytes = peak - self._start_memory
+        self.stages.append(profile)
+        self._current = None
+        return profile
+
+    @contextmanager
+    def stage(self, name: str):
+        """Records the enclosed code as a stage, yielding its profile to add counts"""
+        profile = self.start(name)
+        try:
+            yield profile
+        finally:
+            self.stop()
+
+    def report(self, **info) -> dict:
+        """Machine-readable report of the stages, with `info` such as the generator & model"""
+        return {
+            "version": REPORT_VERSION,
+            **info,
+            "total_seconds": sum(profile.seconds for profile in self.stages),
+            "stages": [asdict(profile) for profile in self.stages],
+        }
+
+    def write(self, path: str, **info):
+        """Writes the report as JSON to `path` and stops tracing if started by the profiler"""
+        if not self.enabled:
+            return
+        self.stop()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        with open(path, "w") as f:
+            json.dump(self.report(**info), f, indent=2)
+
+
+class _LoadStage:
+    """Times a stage of a model load, tracing memory only if tracemalloc is already running"""
+
+    def __init__(self, name: str):
+        self.profile = StageProfile(name)
+        self._tracing = tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.reset_peak()
+            self._start_memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+
+    def stop(self) -> StageProfile:
+        self.profile.seconds = time.perf_counter() - self._start
+        if self._tracing:
+            memory, peak = tracemalloc.get_traced_memory()
+            self.profile.allocated_bytes = memory - self._start_memory
+            self.profile.peak_bytes = peak - self._start_memory
+        return self.profile
+
+
+def instrument_model_load(metamodel):
+    """Records the `parse` & `resolve` stages of each model loaded with `model_from_file`
+
+    textX loads the model before calling the generator, so the stages of that load are kept
+    on the model for `profile_model_load`. The `resolve` stage includes the model processors,
+    i.e. validation. Only the wall time is measured, and the memory only if tracemalloc is
+    already tracing, e.g. with `PYTHONTRACEMALLOC=1`, so that loads without profiling are not
+    slowed down.
+    """
+    if hasattr(metamodel, "_tx_model_repository"):
+        # the global repository registers models in its own pre-resolution callback
+        return
+    # `model_from_file` does not take callbacks, but passes the file on to this method
+    load = metamodel.internal_model_from_file
+
+    def internal_model_from_file(file_name, *args, pre_ref_resolution_callback=None, **kwargs):
+        stages = [_LoadStage("parse")]
+
+        def on_parsed(model):
+            stages[0].stop()
+            stages.append(_LoadStage("resolve"))
+            if pre_ref_resolution_callback is not None:
+                pre_ref_resolution_callback(model)
+
+        model = load(file_name, *args, pre_ref_resolution_callback=on_parsed, **kwargs)
+        stages[-1].stop()
+        profiles = [stage.profile for stage in stages]
+        # the parser keeps the source of the model
+        source = model._tx_parser.input
+        profiles[0].counts["characters"] = len(source)
+        profiles[0].counts["lines"] = source.count("\n") + 1
+        model._tx_load_stages = profiles
+        return model
+
+    metamodel.internal_model_from_file = internal_model_from_file
+
+
+def profile_model_load(profiler: PipelineProfiler, model):
+    """Adds the `parse` & `resolve` stages recorded when loading the model to the profiler
+
+    See `instrument_model_load`. Models not loaded with an instrumented metamodel have no
+    load stages.
+    """
+    if not profiler.enabled:
+        return
+
+    stages = getattr(model, "_tx_load_stages", None)
+    if stages is None:
+        logger.warning("Model not loaded with an instrumented metamodel, its load is not profiled")
+        return
+    profiler.stop()
+    profiler.stages.extend(stages)
+
+
+def ir_counts(ir: dict) -> dict[str, int]:
+    """Numbers of rows of the IR tables"""
+    return {
+        "states": len(ir["states"]),
+        "events": len(ir["events"]),
+        "transitions": len(ir["transitions"]),
+        "reactions": len(ir["reactions"]),
+        "condition_terms": len(ir["term_requires"]),
+        "fired_events": len(ir["fires_events"]),
+    }
@@ -1,17 +1,31 @@
+import logging
 from pathlib import Path
 from textx import GeneratorDesc, LanguageDesc, metamodel_from_file
-from textx.scoping import providers as scoping_providers
 from coord_dsl.generators.classes import (
     State,
     Event,
     Transition,
     FiredEvent,
+    EventLiteral,
+    EventConjunction,
+    EventCondition,
     Reaction,
     FSM,
 )
 from coord_dsl.generators.fsm_graph import gen_cpp_header, get_fsm_graph, gen_json, gen_python_code
+from coord_dsl.generators.optimize import minimize_ir, prune_ir
+from coord_dsl.generators.profiling import (
+    PipelineProfiler,
+    instrument_model_load,
+    ir_counts,
+    profile_model_load,
+)
+from coord_dsl.generators.scoping import FSMScopeProvider
+from coord_dsl.generators.validation import check_fsm_model
 from importlib.resources import files
 
+logger = logging.getLogger(__name__)
+
 GRAMMAR_PATH = str(files("coord_dsl.metamodels").joinpath("fsm.tx"))
 
 __SUPPORTED_GRAPH_FORMATS = {"ttl": "ttl", "xml": "xml", "json-ld": "json"}
@@ -24,15 +38,21 @@ def fsm_metamodel():
             Event,
             Transition,
             FiredEvent,
+            EventLiteral,
+            EventConjunction,
+            EventCondition,
             Reaction,
             FSM,
         ],
     )
     mm.register_scope_providers(
         {
-            "*.*": scoping_providers.FQNImportURI(),
+            "*.*": FSMScopeProvider(),
         }
     )
+    mm.register_model_processor(check_fsm_model)
+    # the stages of loading a model are recorded for the `--profile` option of the generators
+    instrument_model_load(mm)
     return mm
 
 fsm_lang = LanguageDesc(
@@ -43,8 +63,25 @@ fsm_lang = LanguageDesc(
 )
 
 
-def graph_gen_console(metamodel, model, output_path, overwrite, debug, **kwargs):
-    g, context = get_fsm_graph(model)
+def _profiler(metamodel, model, **kwargs) -> PipelineProfiler:
+    """Profiler of a generator run, enabled by the `--profile` option"""
+    profiler = PipelineProfiler(enabled="profile" in kwargs)
+    profile_model_load(profiler, model)
+    return profiler
+
+def _write_profile(profiler: PipelineProfiler, target: str, model, default_path: str, **kwargs):
+    # `--profile` may be given the path of the report
+    path = kwargs.get("profile")
+    if not isinstance(path, str):
+        path = default_path
+    if profiler.enabled:
+        profiler.write(path, generator=target, model=model._tx_filename)
+        print(f"Profile written to {path}")
+
+def _graph_and_serialization(profiler: PipelineProfiler, model, **kwargs) -> str:
+    with profiler.stage("graph") as stage:
+        g, context = get_fsm_graph(model)
+        stage.counts["triples"] = len(g)
 
     ser_args = {"indent": 2, "context": context}
 
@@ -59,64 +96,114 @@ def graph_gen_console(metamodel, model, output_path, overwrite, debug, **kwargs)
 
     ser_args["format"] = format
 
-    print(50*"-")
-    print(g.serialize(**ser_args))
+    with profiler.stage("serialize") as stage:
+        serialized = g.serialize(**ser_args)
+        stage.counts["characters"] = len(serialized)
+    return serialized
 
-def graph_gen_file(metamodel, model, output_path, overwrite, debug, **kwargs):
-    g, context = get_fsm_graph(model)
+def graph_gen_console(metamodel, model, output_path, overwrite, debug, **kwargs):
+    profiler = _profiler(metamodel, model, **kwargs)
 
-    ser_args = {"indent": 2, "context": context}
+    serialized = _graph_and_serialization(profiler, model, **kwargs)
 
-    if "autocompact" in kwargs:
-        ser_args["auto_compact"] = True
-    else:
-        ser_args["auto_compact"] = False
+    print(50*"-")
+    print(serialized)
 
-    format = kwargs.get("format", "json-ld")
-    if format not in __SUPPORTED_GRAPH_FORMATS:
-        raise ValueError(f"Unsupported graph format '{format}', supported formats are: {__SUPPORTED_GRAPH_FORMATS}")
+    model_path = Path(model._tx_filename).parent
+    _write_profile(
+        profiler, "console", model, f"{model_path}/{model.fsm.name}.profile.json", **kwargs
+    )
 
-    ser_args["format"] = format
+def graph_gen_file(metamodel, model, output_path, overwrite, debug, **kwargs):
+    profiler = _profiler(metamodel, model, **kwargs)
+
+    serialized = _graph_and_serialization(profiler, model, **kwargs)
 
     if not output_path:
         model_path = Path(model._tx_filename).parent
-        file_format = __SUPPORTED_GRAPH_FORMATS[format]
+        file_format = __SUPPORTED_GRAPH_FORMATS[kwargs.get("format", "json-ld")]
         output_path = f"{model_path}/{model.fsm.name}.{file_format}"
 
-    with open(output_path, "w") as f:
-        f.write(g.serialize(**ser_args))
+    with profiler.stage("write") as stage:
+        with open(output_path, "w") as f:
+            f.write(serialized)
+        stage.counts["characters"] = len(serialized)
     print(f"FSM graph generated at {output_path}")
 
+    _write_profile(profiler, "file", model, f"{output_path}.profile.json", **kwargs)
+
+def optimize_ir(ir: dict, **kwargs) -> dict:
+    """Applies the IR passes requested through the generator options"""
+    if "prune" in kwargs:
+        ir, report = prune_ir(ir, keep_indices="keepindices" in kwargs)
+        print(report.summary())
+
+    if "minimize" in kwargs:
+        num_states = len(ir["states"])
+        ir = minimize_ir(ir)
+        print(f"Minimization: merged {num_states} states into {len(ir['states'])}")
+
+    return ir
+
+def _ir(profiler: PipelineProfiler, model, **kwargs) -> dict:
+    """Builds and optimizes the IR of the model, recording each step as a stage"""
+    with profiler.stage("graph") as stage:
+        g, _ = get_fsm_graph(model)
+        stage.counts["triples"] = len(g)
+
+    with profiler.stage("ir") as stage:
+        ir = gen_json(g)
+        stage.counts.update(ir_counts(ir))
+
+    if "prune" in kwargs or "minimize" in kwargs:
+        with profiler.stage("optimize") as stage:
+            ir = optimize_ir(ir, **kwargs)
+            stage.counts.update(ir_counts(ir))
+
+    return ir
+
+def _write_code(profiler: PipelineProfiler, output_path: str, rendered: str):
+    with profiler.stage("write") as stage:
+        with open(output_path, "w") as f:
+            f.write(rendered)
+        stage.counts["characters"] = len(rendered)
+
 def gen_cpp(metamodel, model: FSM, output_path, overwrite, debug, **kwargs):
-    g, _ = get_fsm_graph(model)
+    profiler = _profiler(metamodel, model, **kwargs)
 
-    ir = gen_json(g)
+    ir = _ir(profiler, model, **kwargs)
 
-    rendered = gen_cpp_header(ir)
+    with profiler.stage("render") as stage:
+        rendered = gen_cpp_header(ir, specialize="specialize" in kwargs)
+        stage.counts["lines"] = rendered.count("\n")
 
     if not output_path:
         model_path = Path(model._tx_filename).parent
-        output_path = f"{model_path}/{ir["name"]}.hpp"
+        output_path = f"{model_path}/{ir['name']}.hpp"
 
-    with open(output_path, "w") as f:
-        f.write(rendered)
+    _write_code(profiler, output_path, rendered)
     print(f"FSM C code generated at {output_path}")
 
+    _write_profile(profiler, "cpp", model, f"{output_path}.profile.json", **kwargs)
+
 def gen_python(metamodel, model: FSM, output_path, overwrite, debug, **kwargs):
-    g, _ = get_fsm_graph(model)
+    profiler = _profiler(metamodel, model, **kwargs)
 
-    ir = gen_json(g)
+    ir = _ir(profiler, model, **kwargs)
 
-    rendered = gen_python_code(ir)
+    with profiler.stage("render") as stage:
+        rendered = gen_python_code(ir, fast_import="fastimport" in kwargs)
+        stage.counts["lines"] = rendered.count("\n")
 
     if not output_path:
         model_path = Path(model._tx_filename).parent
-        output_path = f"{model_path}/{ir["name"]}.py"
+        output_path = f"{model_path}/{ir['name']}.py"
 
-    with open(output_path, "w") as f:
-        f.write(rendered)
+    _write_code(profiler, output_path, rendered)
     print(f"FSM Python code generated at {output_path}")
 
+    _write_profile(profiler, "python", model, f"{output_path}.profile.json", **kwargs)
+
 
 fsm_console_gen = GeneratorDesc(
     language="coord_dsl_fsm",
@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: MPL-2.0
+from weakref import WeakKeyDictionary
+from textx import get_model
+from textx.scoping import ModelLoader
+from textx.scoping import providers as scoping_providers
+
+
+class FSMScopeProvider(ModelLoader):
+    """Resolves references to FSM elements through name indexes built once per model
+
+    The states, events and transitions of a model are indexed by their class and name when
+    the first reference of the model is resolved, so that each reference is a dictionary
+    lookup. The FSM and each composite state have their own index, and a reference is looked
+    up from the innermost composite state containing it outwards to the FSM, so that names in
+    a sub-FSM shadow those of the enclosing FSMs. References not found in the model's own
+    indexes, e.g. namespaces or elements from other files, are resolved with `FQNImportURI`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._fallback = scoping_providers.FQNImportURI()
+        self._indexes = WeakKeyDictionary()
+
+    def load_models(self, model, encoding="utf-8"):
+        self._fallback.load_models(model, encoding=encoding)
+
+    def __call__(self, obj, attr, obj_ref):
+        model = get_model(obj)
+        indexes = self._indexes.get(model)
+        if indexes is None:
+            indexes = self._build_indexes(model)
+            self._indexes[model] = indexes
+
+        scope = obj
+        while scope is not None:
+            index = indexes.get(id(scope))
+            if index is not None:
+                target = index.get(obj_ref.cls.__name__, {}).get(obj_ref.obj_name)
+                if target is not None:
+                    return target
+            scope = getattr(scope, "parent", None)
+
+        return self._fallback(obj, attr, obj_ref)
+
+    @staticmethod
+    def _build_indexes(model) -> dict[int, dict[str, dict]]:
+        """Name indexes of the FSM and of each composite state, by the id of their container"""
+        fsm = getattr(model, "fsm", None)
+        if fsm is None:
+            return {}
+
+        indexes = {}
+        containers = [fsm]
+        while containers:
+            container = containers.pop()
+            index = {}
+            kinds = [("State", container.states), ("Transition", container.transitions)]
+            if container is fsm:
+                kinds.append(("Event", fsm.events))
+            for cls_name, elements in kinds:
+                names = index.setdefault(cls_name, {})
+                for element in elements:
+                    # first definition wins for duplicated names, as with FQN lookup
+                    names.setdefault(element.name, element)
+            indexes[id(container)] = index
+            containers.extend(state for state in container.states if state.states)
+        return indexes
@@ -0,0 +1,720 @@
+# SPDX-License-Identifier: MPL-2.0
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+from importlib.resources import files
+from typing import Optional
+from textx import TextXError, TextXSemanticError, get_location, metamodel_from_file
+from coord_dsl.generators.classes import EventCondition, EventConjunction, EventLiteral
+from coord_dsl.generators.flatten import fsm_containers, flatten_fsm
+
+FRAGMENTS_GRAMMAR_PATH = str(files("coord_dsl.metamodels").joinpath("fsm_fragments.tx"))
+SECTIONS_GRAMMAR_PATH = str(files("coord_dsl.metamodels").joinpath("fsm_sections.tx"))
+
+_SECTION_RE = re.compile(r"^\s*(TRANSITIONS|REACTIONS)\s*:\s*(//.*)?$")
+_ENTRY_RE = re.compile(r"^\s*([^\d\W]\w*)\s*:\s*(//.*)?$")
+_BLANK_RE = re.compile(r"^\s*(//.*)?$")
+_KEYWORDS = {"FROM", "TO", "WHEN", "DO", "FIRES"}
+_SECTION_KINDS = {"TRANSITIONS": "Transition", "REACTIONS": "Reaction"}
+# kinds of declarations whose names must be unique, as checked by `validate_fsm`
+_UNIQUE_KINDS = {"State", "Event", "Transition", "Reaction"}
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    """Problem found in a model, with 1-based line and column as reported by textX"""
+
+    line: int
+    column: int
+    message: str
+    severity: str = "error"
+
+
+def _diagnostic(obj, message: str, severity: str = "error") -> Diagnostic:
+    location = get_location(obj)
+    return Diagnostic(location["line"], location["col"], message, severity)
+
+
+def _check_reactions(start_state, end_state, reactions) -> tuple[list[tuple[int, str]], bool]:
+    """Reactions of a flat FSM which never fire, and whether its end state is reachable
+
+    `reactions` are (name, from state, to state, event condition) tuples in order of priority,
+    with any hashable keys of the states and conditions. Returns the positions of the reactions
+    which never fire in `reactions` with the reason, and whether the end state is reachable
+    from the start state via the remaining reactions.
+    """
+    never_fire = []
+    successors = {}
+    handled = {}
+    for position, (name, from_state, to_state, condition) in enumerate(reactions):
+        if from_state == end_state:
+            never_fire.append(
+                (position, f"Reaction '{name}' never fires, its transition starts in the end state")
+            )
+            continue
+
+        key = (condition, from_state)
+        if key in handled:
+            never_fire.append(
+                (
+                    position,
+                    f"Reaction '{name}' never fires, reaction '{handled[key]}' "
+                    f"has the same event condition and start state",
+                )
+            )
+            continue
+
+        handled[key] = name
+        successors.setdefault(from_state, []).append(to_state)
+
+    reachable = {start_state}
+    stack = [start_state]
+    while stack:
+        for state in successors.get(stack.pop(), ()):
+            if state not in reachable:
+                reachable.add(state)
+                stack.append(state)
+    return never_fire, end_state in reachable
+
+
+def validate_fsm(fsm) -> list[Diagnostic]:
+    """Checks an FSM model for problems the grammar cannot express
+
+    Errors:
+    - start or end state not being one of the FSM's states, start state of a composite state
+      not being one of its sub-FSM's states, or a composite end state
+    - duplicate names of states, events, transitions or reactions, after flattening the
+      composite states
+
+    Warnings:
+    - start state being the end state
+    - end state not reachable from the start state
+    - reactions whose transition starts in the end state, which never fire
+    - reactions with the same event condition and start state as an earlier reaction,
+      which never fire since only the first matching reaction is handled
+
+    The checks other than those of the start & end states run on the flattened FSM, and all
+    checks use hash indexes and run in time linear in the size of the flattened model.
+    """
+    diagnostics = []
+
+    states = set(map(id, fsm.states))
+    for role, state in (("Start", fsm.start_state), ("End", fsm.end_state)):
+        if id(state) not in states:
+            diagnostics.append(
+                _diagnostic(fsm, f"{role} state '{state.name}' is not a state of FSM '{fsm.name}'")
+            )
+    if fsm.end_state.is_composite:
+        diagnostics.append(
+            _diagnostic(fsm, f"End state '{fsm.end_state.name}' must not be a composite state")
+        )
+    for container, _ in fsm_containers(fsm)[:-1]:
+        if container.start_state not in container.states:
+            diagnostics.append(
+                _diagnostic(
+                    container,
+                    f"Start state '{container.start_state.name}' is not a state of composite "
+                    f"state '{container.name}'",
+                )
+            )
+    if diagnostics:
+        # the composite states cannot be flattened
+        return diagnostics
+    if fsm.start_state is fsm.end_state:
+        diagnostics.append(
+            _diagnostic(
+                fsm, f"Start state '{fsm.start_state.name}' is also the end state", "warning"
+            )
+        )
+
+    flat = flatten_fsm(fsm)
+    for kind, elements in (
+        ("state", flat.states),
+        ("event", fsm.events),
+        ("transition", flat.transitions),
+        ("reaction", flat.reactions),
+    ):
+        seen = set()
+        for element in elements:
+            if element.name in seen:
+                source = getattr(element, "source", element)
+                diagnostics.append(_diagnostic(source, f"Duplicate {kind} name '{element.name}'"))
+            seen.add(element.name)
+
+    never_fire, end_reachable = _check_reactions(
+        id(flat.start_state),
+        id(flat.end_state),
+        [
+            (
+                reaction.name,
+                id(reaction.do.from_state),
+                id(reaction.do.to_state),
+                frozenset(reaction.condition_terms),
+            )
+            for reaction in flat.reactions
+        ],
+    )
+    for position, message in never_fire:
+        diagnostics.append(_diagnostic(flat.reactions[position].source, message, "warning"))
+    if not end_reachable:
+        diagnostics.append(
+            _diagnostic(
+                fsm,
+                f"End state '{fsm.end_state.name}' is not reachable from the start state",
+                "warning",
+            )
+        )
+
+    return diagnostics
+
+
+def check_fsm_model(model, metamodel):
+    """Model processor raising the first error found by `validate_fsm`"""
+    for diagnostic in validate_fsm(model.fsm):
+        if diagnostic.severity == "error":
+            raise TextXSemanticError(
+                diagnostic.message,
+                line=diagnostic.line,
+                col=diagnostic.column,
+                filename=model._tx_filename,
+            )
+
+
+@dataclass
+class _Reference:
+    cls_name: str
+    name: str
+    line: int = 0
+    column: int = 0
+
+
+@dataclass
+class _Fragment:
+    """Parse result of a fragment, positions are relative to the fragment"""
+
+    kind: Optional[str] = None
+    declarations: list[_Reference] = field(default_factory=list)
+    references: list[_Reference] = field(default_factory=list)
+    error: Optional[Diagnostic] = None
+    # names of the (start, end) states of the header or the (from, to) states of a transition
+    states: Optional[tuple[str, str]] = None
+    # transition & event condition of a reaction
+    do: Optional[str] = None
+    condition: Optional[frozenset] = None
+    # line & column of the FSM in the header
+    location: tuple[int, int] = (1, 1)
+
+
+class _Placeholder:
+    """Stand-in of a referenced object, equal to the placeholders of the same name"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, _Placeholder) and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+_FSM_RE = re.compile(r"\bFSM\b")
+
+
+def _line_col(text: str, position: int) -> tuple[int, int]:
+    line = text.count("\n", 0, position)
+    return line + 1, position - (text.rfind("\n", 0, position) + 1) + 1
+
+
+def _model_lines(source: str) -> Optional[list[str]]:
+    """Lines of a model without trailing blank lines, None if not ending with the FSM's brace"""
+    lines = source.split("\n")
+    while lines and _BLANK_RE.match(lines[-1]):
+        lines.pop()
+    if not lines or lines[-1].strip() != "}":
+        return None
+    return lines
+
+
+def _split_entries(
+    lines: list[str], begin: int, end: int, section: Optional[str] = None
+) -> Optional[list[tuple[str, str, int]]]:
+    """Splits `lines[begin:end]` into entries, given the section of line `begin` if in one
+
+    Entries are returned as (section, text, first line index), where `lines[begin]` is a section
+    line or the first line of an entry. Returns None if the lines are not laid out with one
+    entry name per line.
+    """
+    entries = []
+    for index in range(begin, end):
+        line = lines[index]
+        section_match = _SECTION_RE.match(line)
+        if section_match:
+            section = section_match.group(1)
+            continue
+        if section is None:
+            return None
+
+        entry_match = _ENTRY_RE.match(line)
+        if entry_match and entry_match.group(1) not in _KEYWORDS:
+            entries.append([section, [line], index])
+        elif "{" in line.split("//")[0] or "}" in line.split("//")[0]:
+            # braces only close the FSM, which is not part of any entry
+            return None
+        elif entries and entries[-1][0] == section:
+            entries[-1][1].append(line)
+        elif not _BLANK_RE.match(line):
+            return None
+    return [(section, "\n".join(text), start) for section, text, start in entries]
+
+
+def _split(lines: list[str]) -> Optional[tuple[int, list[tuple[str, str, int]]]]:
+    """Splits a model into its header and the entries of the TRANSITIONS & REACTIONS blocks
+
+    Returns the number of lines of the header, i.e. the index of the first section line, and
+    the entries as given by `_split_entries`. Returns None if the model is not laid out with one
+    entry name per line or has composite states, in which case it has to be parsed as a whole.
+    """
+    header_end = None
+    sections = []
+    for index, line in enumerate(lines):
+        section_match = _SECTION_RE.match(line)
+        if section_match:
+            if header_end is None:
+                header_end = index
+            sections.append(section_match.group(1))
+    if sections != ["TRANSITIONS", "REACTIONS"]:
+        # a missing or repeated section is a syntax error, positioned by the full parse
+        return None
+    if sum(line.count("{") for line in lines[:header_end]) > 1:
+        # composite states have their own blocks, and are resolved in nested scopes
+        return None
+
+    entries = _split_entries(lines, header_end, len(lines) - 1)
+    if entries is None:
+        return None
+    return header_end, entries
+
+
+def _common_prefix(a: list[str], b: list[str], limit: int) -> int:
+    # binary search with slice comparisons, which compare the lines in C
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a: list[str], b: list[str], limit: int) -> int:
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle : len(a) - low] == b[len(b) - middle : len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class IncrementalValidator:
+    """Validates successive versions of an FSM model, re-parsing only what changed
+
+    Intended for editors and language servers, which call `update` with the full text of the
+    model after each edit. The header, i.e. everything before the TRANSITIONS block, and each
+    transition & reaction entry are parsed separately and cached by their text. Only the lines
+    between the common prefix & suffix of the previous and new text are split into entries
+    again, so an edit only re-parses the changed entries. References are resolved against
+    indexes of the declared names, and an index from each declared name to the entries
+    referring to it limits re-checking to the changed entries and to the referrers of names
+    that were added or removed.
+
+    Once the references and names are valid, the warnings of `validate_fsm` are computed from
+    the start & end states, transitions and reaction conditions cached with the fragments.
+
+    Models which cannot be split into entries, e.g. because several entries share a line or
+    because of composite states, are parsed as a whole with the FSM metamodel instead.
+    """
+
+    def __init__(self, metamodel=None):
+        if metamodel is None:
+            from coord_dsl.generators.registration import fsm_metamodel
+
+            metamodel = fsm_metamodel()
+        self._metamodel = metamodel
+
+        self._fragment_mm = metamodel_from_file(
+            FRAGMENTS_GRAMMAR_PATH, classes=[EventLiteral, EventConjunction, EventCondition]
+        )
+        self._fragment_mm.register_scope_providers({"*.*": self._record_reference})
+        # created on the first syntax error of an entry
+        self._section_mm = None
+        self._recorded: list[tuple[str, str, int]] = []
+        self._reset()
+
+    def _reset(self):
+        self._lines: Optional[list[str]] = None
+        self._header_end = 0
+        # section, text and first line index of each entry
+        self._sections: list[str] = []
+        self._texts: list[str] = []
+        self._starts: list[int] = []
+        self._header_text: Optional[str] = None
+        self._header = _Fragment()
+        self._fragments: dict[str, _Fragment] = {}
+        self._entries: Counter = Counter()
+        self._declared: dict[tuple[str, str], int] = Counter()
+        self._duplicates: set[tuple[str, str]] = set()
+        self._referrers: dict[tuple[str, str], set[str]] = {}
+        self._declarers: dict[tuple[str, str], set[str]] = {}
+        self._reference_errors: dict[str, list[Diagnostic]] = {}
+        # entries with syntax or reference errors
+        self._invalid: set[str] = set()
+
+    def _record_reference(self, obj, attr, obj_ref):
+        # references are checked against the indexes of declared names after parsing
+        self._recorded.append((obj_ref.cls.__name__, obj_ref.obj_name, obj_ref.position))
+        return _Placeholder(obj_ref.obj_name)
+
+    def _parse_fragment(self, text: str) -> _Fragment:
+        self._recorded = []
+        fragment = _Fragment()
+        try:
+            model = self._fragment_mm.model_from_str(text)
+        except TextXError as e:
+            fragment.error = Diagnostic(e.line or 1, e.col or 1, e.message)
+            return fragment
+
+        for cls_name, name, position in self._recorded:
+            fragment.references.append(_Reference(cls_name, name, *_line_col(text, position)))
+
+        if model.header is not None:
+            header = model.header
+            if model.entries:
+                # the header ends with the first section line, so entries are misplaced
+                line, column = _line_col(text, model.entries[0]._tx_position)
+                fragment.error = Diagnostic(line, column, "Expected ',' or 'TRANSITIONS'")
+                return fragment
+            for cls_name, elements in (
+                ("State", header.states),
+                ("Event", header.events),
+                ("NamespaceDeclare", header.namespaces),
+            ):
+                for element in elements:
+                    line, column = _line_col(text, element._tx_position)
+                    fragment.declarations.append(_Reference(cls_name, element.name, line, column))
+            fragment.states = (header.start_state.name, header.end_state.name)
+            position = header._tx_position
+            if header.namespaces:
+                match = _FSM_RE.search(text, header.namespaces[-1]._tx_position_end)
+                position = match.start() if match else position
+            fragment.location = _line_col(text, position)
+        elif len(model.entries) == 1:
+            entry = model.entries[0]
+            fragment.kind = entry.__class__.__name__
+            fragment.declarations.append(
+                _Reference(fragment.kind, entry.name, *_line_col(text, entry._tx_position))
+            )
+            if fragment.kind == "Transition":
+                fragment.states = (entry.from_state.name, entry.to_state.name)
+            else:
+                fragment.do = entry.do.name
+                fragment.condition = frozenset(entry.when.terms())
+        return fragment
+
+    def _check_references(self, fragment: _Fragment) -> list[Diagnostic]:
+        return [
+            Diagnostic(
+                ref.line, ref.column, f'Unknown object "{ref.name}" of class "{ref.cls_name}"'
+            )
+            for ref in fragment.references
+            if (ref.cls_name, ref.name) not in self._declared
+        ]
+
+    def _declare(self, fragment: _Fragment, count: int, changed: set):
+        for decl in fragment.declarations:
+            key = (decl.cls_name, decl.name)
+            self._declared[key] += count
+            if self._declared[key] <= 0:
+                del self._declared[key]
+                changed.add(key)
+            elif self._declared[key] == count:
+                changed.add(key)
+            if self._declared.get(key, 0) > 1 and decl.cls_name in _UNIQUE_KINDS:
+                self._duplicates.add(key)
+            else:
+                self._duplicates.discard(key)
+
+    def _index(self, text: str, fragment: _Fragment, add: bool):
+        for index, names in (
+            (self._referrers, fragment.references),
+            (self._declarers, fragment.declarations),
+        ):
+            for name in names:
+                texts = index.setdefault((name.cls_name, name.name), set())
+                if add:
+                    texts.add(text)
+                else:
+                    texts.discard(text)
+
+    def _parse_full(self, source: str) -> list[Diagnostic]:
+        try:
+            model = self._metamodel.model_from_str(source)
+        except TextXError as e:
+            return [Diagnostic(e.line or 1, e.col or 1, e.message)]
+        return validate_fsm(model.fsm)
+
+    def _entry_error(self, section: str, text: str, start: int) -> Optional[Diagnostic]:
+        """Syntax error of an entry as reported by the parser of the whole model, if any
+
+        The entry is parsed as an entry of its section, and an error at the end of the entry,
+        e.g. a missing part, is reported at the first token after it.
+        """
+        if self._section_mm is None:
+            self._section_mm = metamodel_from_file(
+                SECTIONS_GRAMMAR_PATH, classes=[EventLiteral, EventConjunction, EventCondition]
+            )
+            self._section_mm.register_scope_providers({"*.*": self._record_reference})
+        # the keyword is prepended to the first line, which only holds the name of the entry,
+        # and the token following the block is appended on a line of its own
+        prefix = f"{section}:"
+        following = "REACTIONS" if section == "TRANSITIONS" else "}"
+        try:
+            self._section_mm.model_from_str(f"{prefix}{text}\n{following}")
+        except TextXError as e:
+            line, column, message = e.line or 1, e.col or 1, e.message
+        else:
+            return None
+        if line == 1:
+            column = max(column - len(prefix), 1)
+
+        num_lines = text.count("\n") + 1
+        if line > num_lines:
+            # the entry ends early, which is reported at the first token after it
+            for index in range(start + num_lines, len(self._lines)):
+                next_line = self._lines[index]
+                if not _BLANK_RE.match(next_line):
+                    column = len(next_line) - len(next_line.lstrip()) + 1
+                    return Diagnostic(index + 1, column, message)
+        return Diagnostic(line + start, column, message)
+
+    def _validate_full(self, source: str) -> list[Diagnostic]:
+        # forget the incremental state, since it no longer matches the model
+        self._reset()
+        return self._parse_full(source)
+
+    def _split_edit(self, lines: list[str]) -> Optional[tuple[list[str], list[str]]]:
+        """Updates the entries for the new lines, splitting only the lines around the edit again
+
+        Returns the texts of the removed & added entries, or None if the edit touches the
+        header, a section line or the closing brace of the FSM, in which case the model has to
+        be split as a whole.
+        """
+        old = self._lines
+        if old is None:
+            return None
+        limit = min(len(old), len(lines))
+        prefix = _common_prefix(old, lines, limit)
+        if prefix == len(old) == len(lines):
+            return [], []
+        suffix = _common_suffix(old, lines, limit - prefix)
+        old_end = len(old) - suffix
+        new_end = len(lines) - suffix
+        if prefix <= self._header_end or suffix == 0:
+            return None
+        for line in old[prefix:old_end] + lines[prefix:new_end]:
+            if _SECTION_RE.match(line):
+                return None
+
+        # from the last entry starting before the edit to the first one starting after it,
+        # whose first lines are unchanged and hence still start entries of the same sections
+        starts = self._starts
+        first = bisect_right(starts, prefix - 1) - 1
+        last = bisect_left(starts, old_end, max(first, 0))
+        if first >= 0:
+            section, begin = self._sections[first], starts[first]
+        else:
+            first, section, begin = 0, None, self._header_end
+        shift = len(lines) - len(old)
+        end = starts[last] + shift if last < len(starts) else len(lines) - 1
+
+        edited = _split_entries(lines, begin, end, section)
+        if edited is None:
+            return None
+        removed = self._texts[first:last]
+        added = [text for _, text, _ in edited]
+        # the lists are spliced in place, so that unchanged entries are not copied
+        self._sections[first:last] = [section for section, _, _ in edited]
+        self._texts[first:last] = added
+        following = starts[last:]
+        starts[first:] = [start for _, _, start in edited]
+        if shift:
+            starts.extend(start + shift for start in following)
+        else:
+            starts.extend(following)
+        return removed, added
+
+    def _check_flat(self) -> list[Diagnostic]:
+        """Warnings of `validate_fsm` from the cached fragments of a model without errors"""
+        diagnostics = []
+        start_state, end_state = self._header.states
+        if start_state == end_state:
+            diagnostics.append(
+                Diagnostic(
+                    *self._header.location,
+                    f"Start state '{start_state}' is also the end state",
+                    "warning",
+                )
+            )
+
+        transitions = {}
+        reactions = []
+        reaction_starts = []
+        for text, start in zip(self._texts, self._starts):
+            fragment = self._fragments[text]
+            if fragment.kind == "Transition":
+                transitions[fragment.declarations[0].name] = fragment.states
+            elif fragment.kind == "Reaction":
+                reactions.append(fragment)
+                reaction_starts.append(start)
+
+        never_fire, end_reachable = _check_reactions(
+            start_state,
+            end_state,
+            (
+                (fragment.declarations[0].name, *transitions[fragment.do], fragment.condition)
+                for fragment in reactions
+            ),
+        )
+        for position, message in never_fire:
+            decl = reactions[position].declarations[0]
+            diagnostics.append(
+                Diagnostic(decl.line + reaction_starts[position], decl.column, message, "warning")
+            )
+        if not end_reachable:
+            diagnostics.append(
+                Diagnostic(
+                    *self._header.location,
+                    f"End state '{end_state}' is not reachable from the start state",
+                    "warning",
+                )
+            )
+        return diagnostics
+
+    def update(self, source: str) -> list[Diagnostic]:
+        """Validates the new text of the model, returning all of its diagnostics"""
+        lines = _model_lines(source)
+        edit = None if lines is None else self._split_edit(lines)
+        if edit is not None:
+            removed_texts, added_texts = edit
+            header_text = self._header_text
+            added = Counter(added_texts)
+            removed = Counter(removed_texts)
+            added, removed = added - removed, removed - added
+        else:
+            split = None if lines is None else _split(lines)
+            if split is None:
+                return self._validate_full(source)
+            self._header_end, entries = split
+            header_text = "\n".join(lines[: self._header_end])
+            self._sections = [section for section, _, _ in entries]
+            self._texts = [text for _, text, _ in entries]
+            self._starts = [start for _, _, start in entries]
+            entry_counts = Counter(self._texts)
+            added = entry_counts - self._entries
+            removed = self._entries - entry_counts
+        self._lines = lines
+
+        changed_names = set()
+        if header_text != self._header_text:
+            self._declare(self._header, -1, changed_names)
+            self._header = self._parse_fragment(header_text)
+            self._header_text = header_text
+            self._declare(self._header, 1, changed_names)
+
+        # parse & index only entries whose text is new
+        for text, count in removed.items():
+            fragment = self._fragments[text]
+            self._declare(fragment, -count, changed_names)
+            self._entries[text] -= count
+            if self._entries[text] <= 0:
+                del self._entries[text]
+                self._index(text, fragment, add=False)
+                del self._fragments[text]
+                self._reference_errors.pop(text, None)
+                self._invalid.discard(text)
+        for text, count in added.items():
+            fragment = self._fragments.get(text)
+            if fragment is None:
+                fragment = self._parse_fragment(text)
+                self._fragments[text] = fragment
+                self._index(text, fragment, add=True)
+                if fragment.error is not None:
+                    self._invalid.add(text)
+            self._declare(fragment, count, changed_names)
+            self._entries[text] += count
+
+        # re-check new entries and the referrers of names that were added or removed
+        recheck = set(added)
+        for key in changed_names:
+            recheck.update(self._referrers.get(key, ()))
+        for text in recheck:
+            fragment = self._fragments.get(text)
+            if fragment is not None and fragment.error is None:
+                errors = self._check_references(fragment)
+                self._reference_errors[text] = errors
+                if errors:
+                    self._invalid.add(text)
+                else:
+                    self._invalid.discard(text)
+
+        # as by the parser of the whole model, only the first syntax error is reported, and the
+        # header and missing sections are parsed as a whole, where errors are found early
+        if (
+            self._header.error is not None
+            or not self._sections
+            or self._sections[0] != "TRANSITIONS"
+            or self._sections[-1] != "REACTIONS"
+        ):
+            return self._parse_full(source)
+        if any(self._fragments[text].error is not None for text in self._invalid):
+            for section, text, start in zip(self._sections, self._texts, self._starts):
+                fragment = self._fragments[text]
+                if fragment.error is not None or fragment.kind != _SECTION_KINDS[section]:
+                    error = self._entry_error(section, text, start)
+                    return self._parse_full(source) if error is None else [error]
+
+        diagnostics = self._check_references(self._header)
+        for decl in self._header.declarations:
+            if (decl.cls_name, decl.name) in self._duplicates:
+                diagnostics.append(
+                    Diagnostic(decl.line, decl.column, f'Duplicate name "{decl.name}"')
+                )
+
+        # only entries with errors or duplicate names are looked at in detail
+        flagged = set(self._invalid)
+        for key in self._duplicates:
+            flagged.update(self._declarers.get(key, ()))
+        for section, text, start in zip(self._sections, self._texts, self._starts):
+            fragment = self._fragments[text]
+            if fragment.kind != _SECTION_KINDS[section]:
+                error = self._entry_error(section, text, start)
+                return self._parse_full(source) if error is None else [error]
+            if text not in flagged:
+                continue
+            errors = list(self._reference_errors.get(text, []))
+            for decl in fragment.declarations:
+                if (decl.cls_name, decl.name) in self._duplicates:
+                    errors.append(
+                        Diagnostic(decl.line, decl.column, f'Duplicate name "{decl.name}"')
+                    )
+            diagnostics.extend(
+                Diagnostic(d.line + start, d.column, d.message, d.severity) for d in errors
+            )
+
+        if not diagnostics:
+            diagnostics = self._check_flat()
+        return diagnostics
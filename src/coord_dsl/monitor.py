@@ -0,0 +1,158 @@
+# SPDX-License-Identifier: MPL-2.0
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from coord_dsl.fsm import FSMData
+
+MAGIC = b"CDSM"
+VERSION = 1
+# retries of a read while a slot is written, before its writer is assumed to be dead
+MAX_READ_RETRIES = 100_000
+
+# magic, version, number of slots, padded so that slots are 8-byte aligned
+_HEADER = struct.Struct("<4sII4x")
+# sequence number, tick, state index, last fired reaction index (-1 if none yet), padding
+_SLOT = struct.Struct("<QQii8x")
+_SEQ = struct.Struct("<Q")
+_FIELDS = struct.Struct("<Qii")
+
+
+@dataclass(frozen=True)
+class SlotState:
+    """Consistent copy of a monitor slot"""
+
+    tick: int
+    state: int
+    last_reaction: int
+
+
+class MonitorSlot:
+    """Writer of the slot of one FSM instance, see `StateMonitor.attach`
+
+    Each record is guarded by a sequence number, which is odd while the fields are written,
+    so that readers can detect and retry torn reads without any locking by the writer.
+    """
+
+    def __init__(self, buffer: mmap.mmap, offset: int):
+        self._buffer = buffer
+        self._offset = offset
+        self._seq = _SEQ.unpack_from(buffer, offset)[0] & ~1
+        self.tick = 0
+        self.last_reaction = -1
+
+    def record(self, state: int, reaction: int | None):
+        """Counts a tick and mirrors the current state and the last fired reaction"""
+        self.tick += 1
+        if reaction is not None:
+            self.last_reaction = reaction
+        self.write(state)
+
+    def write(self, state: int):
+        """Mirrors the current state without counting a tick"""
+        buffer = self._buffer
+        offset = self._offset
+        self._seq += 1
+        _SEQ.pack_into(buffer, offset, self._seq)
+        _FIELDS.pack_into(buffer, offset + 8, self.tick, state, self.last_reaction)
+        self._seq += 1
+        _SEQ.pack_into(buffer, offset, self._seq)
+
+
+class StateMonitor:
+    """Fixed-layout memory-mapped file mirroring the state of FSM instances for other processes
+
+    Given `num_slots`, the file is created with that many slots, and FSM instances are
+    attached to slots with `attach`, after which `fsm_step` records into them. Without
+    `num_slots`, an existing file is mapped read-only, e.g. by a dashboard, and the slots are
+    read with `read` or `read_all`. An existing file is only replaced if `overwrite` is set,
+    in which case it is unlinked first, so that readers still mapping it are not truncated.
+
+    The file starts with a 16-byte header (magic `CDSM`, version, number of slots as
+    little-endian 32-bit integers), followed by 32-byte slots of a 64-bit sequence number,
+    a 64-bit tick counter, the 32-bit current state index and the 32-bit index of the last
+    fired reaction. Slots are updated like a seqlock: the sequence number is odd while a slot
+    is written, and a read is consistent if the number is even and unchanged after reading
+    the fields. Writes are plain memory writes, so stepping involves no locks or system calls.
+    Placing the file on a RAM-backed file system such as `/dev/shm` avoids writeback to disk.
+    """
+
+    def __init__(self, path: str, num_slots: int | None = None, overwrite: bool = False):
+        self.path = path
+        if num_slots is not None:
+            assert num_slots > 0, f"Monitor needs at least one slot, got '{num_slots}'"
+            size = _HEADER.size + num_slots * _SLOT.size
+            if overwrite and os.path.exists(path):
+                os.unlink(path)
+            # raises FileExistsError instead of truncating a file other processes may map
+            with open(path, "x+b") as f:
+                f.truncate(size)
+                self._buffer = mmap.mmap(f.fileno(), size)
+            _HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, num_slots)
+        else:
+            with open(path, "rb") as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.num_slots = _HEADER.unpack_from(self._buffer, 0)
+        assert magic == MAGIC, f"'{path}' is not an FSM state monitor"
+        assert version == VERSION, f"Unsupported monitor version '{version}'"
+        assert len(self._buffer) >= _HEADER.size + self.num_slots * _SLOT.size, (
+            f"Monitor '{path}' is truncated"
+        )
+
+    def _offset(self, slot: int) -> int:
+        assert 0 <= slot < self.num_slots, f"Slot '{slot}' out of range [0, {self.num_slots})"
+        return _HEADER.size + slot * _SLOT.size
+
+    def attach(self, fsm: FSMData, slot: int) -> MonitorSlot:
+        """Mirrors the state of `fsm` into `slot` from now on, starting with its current state"""
+        monitor_slot = MonitorSlot(self._buffer, self._offset(slot))
+        monitor_slot.write(fsm.current_state_index)
+        fsm.monitor = monitor_slot
+        return monitor_slot
+
+    def read(self, slot: int, max_retries: int = MAX_READ_RETRIES) -> SlotState:
+        """Reads a consistent copy of a slot, retrying while it is written
+
+        Raises a TimeoutError if the slot is still being written after `max_retries` retries,
+        e.g. because its writer died in the middle of a write.
+        """
+        offset = self._offset(slot)
+        buffer = self._buffer
+        for _ in range(max_retries + 1):
+            seq = _SEQ.unpack_from(buffer, offset)[0]
+            if seq & 1:
+                continue
+            tick, state, last_reaction = _FIELDS.unpack_from(buffer, offset + 8)
+            if _SEQ.unpack_from(buffer, offset)[0] == seq:
+                return SlotState(tick, state, last_reaction)
+        raise TimeoutError(
+            f"Slot '{slot}' of monitor '{self.path}' is still being written after "
+            f"{max_retries} retries, its writer may have died while writing"
+        )
+
+    def read_all(self, max_retries: int = MAX_READ_RETRIES) -> list[SlotState]:
+        """Reads consistent copies of all slots
+
+        All slots are copied at once, and only slots written during the copy are read again,
+        see `read`.
+        """
+        end = _HEADER.size + self.num_slots * _SLOT.size
+        copy = self._buffer[_HEADER.size : end]
+        states = []
+        for slot, (seq, tick, state, last_reaction) in enumerate(_SLOT.iter_unpack(copy)):
+            if seq & 1 or _SEQ.unpack_from(self._buffer, self._offset(slot))[0] != seq:
+                states.append(self.read(slot, max_retries))
+            else:
+                states.append(SlotState(tick, state, last_reaction))
+        return states
+
+    def close(self):
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
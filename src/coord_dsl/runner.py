@@ -0,0 +1,161 @@
+# SPDX-License-Identifier: MPL-2.0
+import logging
+import math
+from dataclasses import dataclass
+from typing import Callable
+from coord_dsl.clock import Clock, EventTimers, MonotonicClock, VirtualClock
+from coord_dsl.event_loop import produce_event, reconfig_event_buffers
+from coord_dsl.fsm import FSMData, fsm_dispatch, fsm_step
+from coord_dsl.gateway import EventGateway
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoopStats:
+    """Timing of the ticks run by a `LoopRunner`
+
+    The jitter of a period is the difference between the time from the start of a tick to the
+    start of the next one and the nominal period.
+    """
+
+    num_ticks: int = 0
+    # idle ticks skipped with a `VirtualClock`, see `LoopRunner`
+    num_skipped: int = 0
+    num_misses: int = 0
+    num_periods: int = 0
+    max_jitter: float = 0.0
+    mean_jitter: float = 0.0
+    # sum of squared differences from the mean jitter, see `std_jitter`
+    _jitter_m2: float = 0.0
+
+    @property
+    def std_jitter(self) -> float:
+        if self.num_periods < 2:
+            return 0.0
+        return math.sqrt(self._jitter_m2 / (self.num_periods - 1))
+
+    def add_jitter(self, jitter: float):
+        # Welford's online algorithm
+        self.num_periods += 1
+        delta = jitter - self.mean_jitter
+        self.mean_jitter += delta / self.num_periods
+        self._jitter_m2 += delta * (jitter - self.mean_jitter)
+        self.max_jitter = max(self.max_jitter, abs(jitter))
+
+
+class LoopRunner:
+    """Runs an FSM at a fixed period
+
+    Each tick produces the optional `step_event` and the events of due `timers`, runs the
+    behaviour, `fsm_step` and `reconfig_event_buffers`. Ticks are scheduled at absolute deadlines
+    `start + n * period` on the clock, a `MonotonicClock` by default, so that the period does not
+    drift with the cost of a tick. With a `VirtualClock`, ticks run back to back in simulated time,
+    and idle ticks are skipped if `skip_idle` is set: after a tick in which no timer was due, the state
+    did not change and the events for the next tick are those the tick reacted to, the following
+    ticks would repeat it until a timer is due, so the clock jumps to the first deadline at or
+    after the next due time of the `timers`. Behaviours are not called in the skipped ticks.
+    If a `gateway` is given, state changes are published after `fsm_step`, and the received
+    events are produced before the event buffers are reconfigured.
+
+    A tick that finishes after its deadline is a deadline miss: it is counted, logged, and if an
+    `overrun_event` is given, that event is produced so that the FSM can react to it in the next
+    tick. The missed periods are skipped instead of being run in a burst to catch up.
+
+    The behaviour defaults to `fsm_dispatch`, i.e. the `on_step` hooks of the states.
+    """
+
+    def __init__(
+        self,
+        fsm: FSMData,
+        period: float,
+        behavior: Callable[[FSMData], None] | None = None,
+        step_event: int | None = None,
+        overrun_event: int | None = None,
+        clock: Clock | None = None,
+        timers: EventTimers | None = None,
+        gateway: EventGateway | None = None,
+        skip_idle: bool = False,
+    ):
+        assert period > 0, f"Loop period must be positive, got '{period}'"
+        self.fsm = fsm
+        self.period = period
+        self.behavior = behavior if behavior is not None else fsm_dispatch
+        self.step_event = step_event
+        self.overrun_event = overrun_event
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.timers = timers
+        self.gateway = gateway
+        # events received by a gateway cannot be foreseen, so ticks are never idle
+        self.skip_idle = (
+            skip_idle
+            and isinstance(self.clock, VirtualClock)
+            and timers is not None
+            and gateway is None
+        )
+        self.stats = LoopStats()
+
+    def run(self, max_ticks: int | None = None) -> LoopStats:
+        """Runs ticks until the end state is reached or `max_ticks` ticks were run"""
+        fsm = self.fsm
+        stats = self.stats
+        clock = self.clock
+        deadline = clock.now()
+        last_start = None
+        ticks = 0
+        while fsm.current_state_index != fsm.end_state_index:
+            if max_ticks is not None and ticks >= max_ticks:
+                break
+
+            start = clock.now()
+            if last_start is not None:
+                stats.add_jitter(start - last_start - self.period)
+            last_start = start
+
+            state = fsm.current_state_index
+            events = fsm.event_data.current_mask
+            if self.step_event is not None:
+                produce_event(fsm.event_data, self.step_event)
+            timed = 0
+            if self.timers is not None:
+                timed = self.timers.produce_due(fsm.event_data)
+            self.behavior(fsm)
+            fsm_step(fsm)
+            if self.gateway is not None:
+                self.gateway.publish()
+                self.gateway.poll()
+            ticks += 1
+            stats.num_ticks += 1
+
+            # checked before reconfiguring the event buffers, so that the overrun event is
+            # current in the next tick
+            deadline += self.period
+            now = clock.now()
+            if now > deadline:
+                stats.num_misses += 1
+                logger.warning(
+                    "Deadline missed by %.6fs in tick %d (%d misses)",
+                    now - deadline,
+                    stats.num_ticks,
+                    stats.num_misses,
+                )
+                if self.overrun_event is not None:
+                    produce_event(fsm.event_data, self.overrun_event)
+                deadline += (math.floor((now - deadline) / self.period) + 1) * self.period
+
+            reconfig_event_buffers(fsm.event_data)
+            if (
+                self.skip_idle
+                and not timed
+                and fsm.current_state_index == state
+                and fsm.event_data.current_mask == events
+            ):
+                due = self.timers.next_due()
+                if due is not None and due > deadline:
+                    skipped = math.ceil((due - deadline) / self.period)
+                    deadline += skipped * self.period
+                    last_start += skipped * self.period
+                    stats.num_skipped += skipped
+            clock.sleep_until(deadline)
+
+        return stats
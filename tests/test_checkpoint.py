@@ -0,0 +1,170 @@
+# SPDX-License-Identifier: MPL-2.0
+import random
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from coord_dsl.checkpoint import restore_fleet, snapshot_fleet, table_digest
+from coord_dsl.event_loop import EventData, EventPayloads, produce_event
+from coord_dsl.fsm import fsm_from_ir
+from coord_dsl.generators.fsm_graph import gen_json, get_fsm_graph
+from coord_dsl.generators.registration import fsm_metamodel
+
+EXAMPLE = (Path(__file__).parents[1] / "examples/models/fsm/example.fsm").read_text()
+
+NUM_WIDE_EVENTS = 70
+
+
+def _wide_model() -> str:
+    """Model with more events than fit into a 64-bit mask"""
+    events = ", ".join(f"E_{index}" for index in range(NUM_WIDE_EVENTS))
+    reactions = "".join(
+        f"    R_{index}:\n        WHEN: @E_{index}\n        DO: @T_START_EXIT\n"
+        for index in range(NUM_WIDE_EVENTS)
+    )
+    return (
+        'ns ex = "http://example.org/"\n\n'
+        "FSM (ns=ex) wide {\n"
+        'DESCRIPTION: "Model with many events"\n\n'
+        "STATES: S_START, S_EXIT\n\n"
+        "START_STATE: @S_START\n"
+        "END_STATE: @S_EXIT\n\n"
+        f"EVENTS: {events}\n\n"
+        "TRANSITIONS:\n"
+        "    T_START_EXIT:\n"
+        "        FROM: @S_START\n"
+        "        TO: @S_EXIT\n\n"
+        f"REACTIONS:\n{reactions}"
+        "}\n"
+    )
+
+
+@pytest.fixture(scope="module")
+def irs():
+    metamodel = fsm_metamodel()
+    return [
+        gen_json(get_fsm_graph(metamodel.model_from_str(source))[0])
+        for source in (EXAMPLE, _wide_model())
+    ]
+
+
+def _fleet(irs: list[dict], size: int) -> list:
+    """Instances of the models in turn, each with its own tables"""
+    return [fsm_from_ir(irs[position % len(irs)]) for position in range(size)]
+
+
+def _shared_fleet(ir: dict, size: int) -> list:
+    """Instances sharing the tables of one model, like those of the fast-import `create_fsm`"""
+    fsm = fsm_from_ir(ir)
+    return [replace(fsm, event_data=EventData(len(ir["events"]))) for _ in range(size)]
+
+
+def _randomize(fleet: list, seed: int):
+    rng = random.Random(seed)
+    for fsm in fleet:
+        fsm.current_state_index = rng.randrange(fsm.num_states)
+        fsm.event_data.current_mask = rng.getrandbits(fsm.event_data.num_events)
+        fsm.event_data.future_mask = rng.getrandbits(fsm.event_data.num_events)
+
+
+def _runtime_state(fleet: list) -> list[tuple[int, int, int]]:
+    return [
+        (fsm.current_state_index, fsm.event_data.current_mask, fsm.event_data.future_mask)
+        for fsm in fleet
+    ]
+
+
+def test_table_digest_depends_only_on_the_tables(irs):
+    example, wide = irs
+    fsm = fsm_from_ir(example)
+    other = fsm_from_ir(example)
+    other.current_state_index = 3
+    other.event_data.current_mask = 0b101
+
+    assert table_digest(fsm) == table_digest(other)
+    assert table_digest(fsm) != table_digest(fsm_from_ir(wide))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_round_trip_of_mixed_fleet(irs, seed):
+    fleet = _fleet(irs, 50)
+    _randomize(fleet, seed)
+
+    restored = _fleet(irs, 50)
+    restore_fleet(snapshot_fleet(fleet), restored)
+
+    assert _runtime_state(restored) == _runtime_state(fleet)
+
+
+def test_round_trip_of_fleet_sharing_tables(irs):
+    fleet = _shared_fleet(irs[0], 20)
+    _randomize(fleet, 0)
+
+    restored = _shared_fleet(irs[0], 20)
+    restore_fleet(snapshot_fleet(fleet), restored)
+
+    assert _runtime_state(restored) == _runtime_state(fleet)
+
+
+def test_snapshot_rejects_pending_payloads(irs):
+    fleet = _fleet(irs[:1], 3)
+    num_events = len(irs[0]["events"])
+    fleet[1].event_data.payloads = EventPayloads(num_events)
+    produce_event(fleet[1].event_data, 0, payload=1.0)
+
+    with pytest.raises(ValueError, match="instance 1 has pending event payloads"):
+        snapshot_fleet(fleet)
+
+
+def test_restore_clears_payloads(irs):
+    fleet = _fleet(irs[:1], 2)
+    blob = snapshot_fleet(fleet)
+    num_events = len(irs[0]["events"])
+    for fsm in fleet:
+        fsm.event_data.payloads = EventPayloads(num_events)
+        produce_event(fsm.event_data, 0, payload=1.0)
+
+    restore_fleet(blob, fleet)
+
+    for fsm in fleet:
+        assert not fsm.event_data.payloads.future_produced
+        assert fsm.event_data.payloads.future_counts[0] == 0
+
+
+@pytest.mark.parametrize(
+    "corrupt, message",
+    [
+        (lambda blob: b"XXXX" + blob[4:], "Not an FSM fleet snapshot"),
+        (lambda blob: blob[:3], "Not an FSM fleet snapshot"),
+        (lambda blob: blob[:4] + b"\x02" + blob[5:], "Unsupported snapshot version"),
+        (lambda blob: blob[:-1], "Snapshot is truncated"),
+        (lambda blob: blob + b"\x00", "inconsistent with its header"),
+    ],
+    ids=["magic", "short", "version", "truncated", "trailing"],
+)
+def test_restore_rejects_invalid_blobs(irs, corrupt, message):
+    fleet = _fleet(irs, 4)
+    _randomize(fleet, 0)
+    blob = snapshot_fleet(fleet)
+
+    restored = _fleet(irs, 4)
+    before = _runtime_state(restored)
+    with pytest.raises(ValueError, match=message):
+        restore_fleet(corrupt(blob), restored)
+    assert _runtime_state(restored) == before
+
+
+def test_restore_rejects_other_fleets(irs):
+    fleet = _fleet(irs, 4)
+    _randomize(fleet, 0)
+    blob = snapshot_fleet(fleet)
+
+    with pytest.raises(ValueError, match="Snapshot contains 4 instances"):
+        restore_fleet(blob, _fleet(irs, 3))
+    # same size, but the instances of the models are swapped
+    swapped = _fleet(irs[::-1], 4)
+    before = _runtime_state(swapped)
+    with pytest.raises(ValueError, match="do not match the tables"):
+        restore_fleet(blob, swapped)
+    assert _runtime_state(swapped) == before
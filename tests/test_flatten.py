@@ -0,0 +1,188 @@
+# SPDX-License-Identifier: MPL-2.0
+from pathlib import Path
+
+import pytest
+
+from coord_dsl.event_loop import reconfig_event_buffers
+from coord_dsl.fsm import fsm_from_ir, fsm_step
+from coord_dsl.generators.flatten import flatten_fsm
+from coord_dsl.generators.fsm_graph import gen_json, get_fsm_graph
+from coord_dsl.generators.registration import fsm_metamodel
+
+EXAMPLE = (Path(__file__).parents[1] / "examples/models/fsm/example.fsm").read_text()
+
+COMPOSITE = '''ns ex = "http://example.org/"
+
+FSM (ns=ex) robot {
+DESCRIPTION: "Robot with a nested motion sub-FSM"
+
+STATES: S_START,
+        S_MOVE {
+            STATES: S_PLAN, S_EXECUTE {
+                STATES: S_ACCEL, S_CRUISE
+                START_STATE: @S_ACCEL
+                TRANSITIONS:
+                    T_ACCEL_CRUISE:
+                        FROM: @S_ACCEL
+                        TO: @S_CRUISE
+                REACTIONS:
+                    R_AT_SPEED:
+                        WHEN: @E_AT_SPEED
+                        DO: @T_ACCEL_CRUISE
+            }
+            START_STATE: @S_PLAN
+            TRANSITIONS:
+                T_PLAN_EXECUTE:
+                    FROM: @S_PLAN
+                    TO: @S_EXECUTE
+                T_EXECUTE_PLAN:
+                    FROM: @S_EXECUTE
+                    TO: @S_PLAN
+                T_DONE:
+                    FROM: @S_EXECUTE
+                    TO: @S_EXIT
+            REACTIONS:
+                R_PLANNED:
+                    WHEN: @E_PLANNED
+                    DO: @T_PLAN_EXECUTE
+                R_REPLAN:
+                    WHEN: @E_STOP & @E_REPLAN
+                    DO: @T_EXECUTE_PLAN
+                R_DONE:
+                    WHEN: @E_DONE
+                    DO: @T_DONE
+        },
+        S_EXIT
+
+START_STATE: @S_START
+END_STATE: @S_EXIT
+
+EVENTS: E_STEP, E_PLANNED, E_AT_SPEED, E_REPLAN, E_DONE, E_STOP
+
+TRANSITIONS:
+    T_START_MOVE:
+        FROM: @S_START
+        TO: @S_MOVE
+    T_STOP:
+        FROM: @S_MOVE
+        TO: @S_EXIT
+
+REACTIONS:
+    R_STEP:
+        WHEN: @E_STEP
+        DO: @T_START_MOVE
+    R_STOP:
+        WHEN: @E_STOP
+        DO: @T_STOP
+}
+'''
+
+
+@pytest.fixture(scope="module")
+def metamodel():
+    return fsm_metamodel()
+
+
+@pytest.fixture(scope="module")
+def composite(metamodel):
+    return metamodel.model_from_str(COMPOSITE)
+
+
+def _names(elements) -> list[str]:
+    return [element.name for element in elements]
+
+
+def test_flat_model_is_unchanged(metamodel):
+    fsm = metamodel.model_from_str(EXAMPLE).fsm
+    flat = flatten_fsm(fsm)
+
+    assert _names(flat.states) == _names(fsm.states)
+    assert _names(flat.transitions) == _names(fsm.transitions)
+    assert _names(flat.reactions) == _names(fsm.reactions)
+    assert flat.start_state.name == "S_START"
+    assert flat.end_state.name == "S_EXIT"
+
+
+def test_composite_states_are_replaced_by_their_leaves(composite):
+    flat = flatten_fsm(composite.fsm)
+
+    assert _names(flat.states) == [
+        "S_START",
+        "S_MOVE__S_PLAN",
+        "S_MOVE__S_EXECUTE__S_ACCEL",
+        "S_MOVE__S_EXECUTE__S_CRUISE",
+        "S_EXIT",
+    ]
+    assert flat.start_state.name == "S_START"
+    assert flat.end_state.name == "S_EXIT"
+
+
+def test_transitions_enter_start_leaves_and_leave_from_every_leaf(composite):
+    flat = flatten_fsm(composite.fsm)
+    ends = {
+        transition.name: (transition.from_state.name, transition.to_state.name)
+        for transition in flat.transitions
+    }
+
+    # entering a composite state enters the start state of its sub-FSM, recursively
+    assert ends["T_START_MOVE"] == ("S_START", "S_MOVE__S_PLAN")
+    assert ends["S_MOVE__T_PLAN_EXECUTE"] == ("S_MOVE__S_PLAN", "S_MOVE__S_EXECUTE__S_ACCEL")
+    # leaving a composite state is expanded into a transition from each of its leaves
+    assert {name: ends[name] for name in ends if name.startswith("T_STOP")} == {
+        "T_STOP__S_MOVE__S_PLAN": ("S_MOVE__S_PLAN", "S_EXIT"),
+        "T_STOP__S_MOVE__S_EXECUTE__S_ACCEL": ("S_MOVE__S_EXECUTE__S_ACCEL", "S_EXIT"),
+        "T_STOP__S_MOVE__S_EXECUTE__S_CRUISE": ("S_MOVE__S_EXECUTE__S_CRUISE", "S_EXIT"),
+    }
+    # sub-FSM transitions may target states of the enclosing FSM
+    assert ends["S_MOVE__T_DONE__S_EXECUTE__S_CRUISE"] == (
+        "S_MOVE__S_EXECUTE__S_CRUISE",
+        "S_EXIT",
+    )
+
+
+def test_inner_reactions_take_priority(composite):
+    flat = flatten_fsm(composite.fsm)
+    names = _names(flat.reactions)
+
+    assert names.index("S_MOVE__S_EXECUTE__R_AT_SPEED") < names.index("S_MOVE__R_PLANNED")
+    assert max(names.index(name) for name in names if name.startswith("S_MOVE__")) < min(
+        names.index(name) for name in names if name.startswith("R_STOP__")
+    )
+    stop = {
+        reaction.name: reaction.do.name
+        for reaction in flat.reactions
+        if reaction.name.startswith("R_STOP")
+    }
+    assert stop == {
+        "R_STOP__S_MOVE__S_PLAN": "T_STOP__S_MOVE__S_PLAN",
+        "R_STOP__S_MOVE__S_EXECUTE__S_ACCEL": "T_STOP__S_MOVE__S_EXECUTE__S_ACCEL",
+        "R_STOP__S_MOVE__S_EXECUTE__S_CRUISE": "T_STOP__S_MOVE__S_EXECUTE__S_CRUISE",
+    }
+
+
+def test_flattened_model_steps_through_the_sub_fsms(composite):
+    ir = gen_json(get_fsm_graph(composite)[0])
+    fsm = fsm_from_ir(ir)
+    events = ir["events"]
+
+    visited = []
+    for step in (
+        ["E_STEP"],
+        ["E_PLANNED"],
+        ["E_AT_SPEED"],
+        # the inner replanning reaction takes priority over stopping the composite state
+        ["E_STOP", "E_REPLAN"],
+        ["E_STOP"],
+    ):
+        fsm.event_data.current_mask = sum(1 << events.index(name) for name in step)
+        fsm_step(fsm)
+        reconfig_event_buffers(fsm.event_data)
+        visited.append(ir["states"][fsm.current_state_index])
+
+    assert visited == [
+        "S_MOVE__S_PLAN",
+        "S_MOVE__S_EXECUTE__S_ACCEL",
+        "S_MOVE__S_EXECUTE__S_CRUISE",
+        "S_MOVE__S_PLAN",
+        "S_EXIT",
+    ]
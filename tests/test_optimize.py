@@ -0,0 +1,252 @@
+# SPDX-License-Identifier: MPL-2.0
+import random
+from pathlib import Path
+
+import pytest
+
+from coord_dsl.event_loop import reconfig_event_buffers
+from coord_dsl.fsm import fsm_from_ir, fsm_step
+from coord_dsl.generators.fsm_graph import gen_json, get_fsm_graph
+from coord_dsl.generators.optimize import minimize_ir, prune_ir
+from coord_dsl.generators.registration import fsm_metamodel
+
+EXAMPLE = (Path(__file__).parents[1] / "examples/models/fsm/example.fsm").read_text()
+
+PRUNED = '''ns ex = "http://example.org/"
+
+FSM (ns=ex) pruned {
+DESCRIPTION: "Model with elements that never take effect"
+
+STATES: S_START, S_A, S_B, S_DEAD, S_EXIT
+
+START_STATE: @S_START
+END_STATE: @S_EXIT
+
+EVENTS: E_GO, E_BACK, E_UNUSED, E_STOP
+
+TRANSITIONS:
+    T_START_A:
+        FROM: @S_START
+        TO: @S_A
+    T_A_B:
+        FROM: @S_A
+        TO: @S_B
+    T_B_A:
+        FROM: @S_B
+        TO: @S_A
+    T_B_EXIT:
+        FROM: @S_B
+        TO: @S_EXIT
+    T_DEAD_EXIT:
+        FROM: @S_DEAD
+        TO: @S_EXIT
+    T_A_EXIT:
+        FROM: @S_A
+        TO: @S_EXIT
+    T_EXIT_A:
+        FROM: @S_EXIT
+        TO: @S_A
+
+REACTIONS:
+    R_GO:
+        WHEN: @E_GO
+        DO: @T_START_A
+    R_A_B:
+        WHEN: @E_GO
+        DO: @T_A_B
+    R_SHADOWED:
+        WHEN: @E_GO & @E_BACK
+        DO: @T_A_B
+    R_UNSATISFIABLE:
+        WHEN: @E_STOP & !@E_STOP
+        DO: @T_A_EXIT
+    R_B_A:
+        WHEN: @E_BACK
+        DO: @T_B_A
+    R_B_EXIT:
+        WHEN: @E_STOP
+        DO: @T_B_EXIT
+    R_DEAD:
+        WHEN: @E_STOP
+        DO: @T_DEAD_EXIT
+    R_AFTER_END:
+        WHEN: @E_GO
+        DO: @T_EXIT_A
+}
+'''
+
+# the left & right branches only differ in their names
+MIRRORED = '''ns ex = "http://example.org/"
+
+FSM (ns=ex) mirrored {
+DESCRIPTION: "Model with equivalent branches"
+
+STATES: S_START, S_LEFT, S_RIGHT, S_LEFT_DONE, S_RIGHT_DONE, S_EXIT
+
+START_STATE: @S_START
+END_STATE: @S_EXIT
+
+EVENTS: E_LEFT, E_RIGHT, E_GO, E_STOP, E_DONE
+
+TRANSITIONS:
+    T_START_LEFT:
+        FROM: @S_START
+        TO: @S_LEFT
+    T_START_RIGHT:
+        FROM: @S_START
+        TO: @S_RIGHT
+    T_LEFT_DONE:
+        FROM: @S_LEFT
+        TO: @S_LEFT_DONE
+    T_RIGHT_DONE:
+        FROM: @S_RIGHT
+        TO: @S_RIGHT_DONE
+    T_LEFT_EXIT:
+        FROM: @S_LEFT_DONE
+        TO: @S_EXIT
+    T_RIGHT_EXIT:
+        FROM: @S_RIGHT_DONE
+        TO: @S_EXIT
+
+REACTIONS:
+    R_START_LEFT:
+        WHEN: @E_LEFT
+        DO: @T_START_LEFT
+    R_START_RIGHT:
+        WHEN: @E_RIGHT
+        DO: @T_START_RIGHT
+    R_LEFT_DONE:
+        WHEN: @E_GO
+        DO: @T_LEFT_DONE
+        FIRES: @E_DONE
+    R_RIGHT_DONE:
+        WHEN: @E_GO
+        DO: @T_RIGHT_DONE
+        FIRES: @E_DONE
+    R_LEFT_EXIT:
+        WHEN: @E_STOP
+        DO: @T_LEFT_EXIT
+    R_RIGHT_EXIT:
+        WHEN: @E_STOP
+        DO: @T_RIGHT_EXIT
+}
+'''
+
+
+@pytest.fixture(scope="module")
+def metamodel():
+    return fsm_metamodel()
+
+
+def _ir(metamodel, source: str) -> dict:
+    return gen_json(get_fsm_graph(metamodel.model_from_str(source))[0])
+
+
+def _trace(ir: dict, steps: list[set[str]]) -> list[tuple[int, set[str]]]:
+    """State index and names of the fired events after stepping with each set of events"""
+    fsm = fsm_from_ir(ir)
+    events = ir["events"]
+    trace = []
+    for step in steps:
+        fsm.event_data.current_mask = sum(
+            1 << index for index, name in enumerate(events) if name in step
+        )
+        fsm_step(fsm)
+        future = fsm.event_data.future_mask
+        fired = {name for index, name in enumerate(events) if future >> index & 1}
+        trace.append((fsm.current_state_index, fired))
+        reconfig_event_buffers(fsm.event_data)
+    return trace
+
+
+def _random_steps(ir: dict, seed: int, count: int = 200) -> list[set[str]]:
+    rng = random.Random(seed)
+    return [{name for name in ir["events"] if rng.random() < 0.3} for _ in range(count)]
+
+
+def test_prune_reports_removed_elements(metamodel):
+    pruned, report = prune_ir(_ir(metamodel, PRUNED))
+
+    assert report.reactions == {
+        "R_SHADOWED": "shadowed by earlier reactions",
+        "R_UNSATISFIABLE": "event condition can never be satisfied",
+        "R_AFTER_END": "transition starts in the end state",
+        "R_DEAD": "transition starts in an unreachable state",
+    }
+    assert report.transitions == {
+        "T_DEAD_EXIT": "starts in an unreachable state",
+        "T_A_EXIT": "not used by any reaction",
+        "T_EXIT_A": "not used by any reaction",
+    }
+    assert report.states == {"S_DEAD": "not reachable from the start state"}
+    assert report.events == {"E_UNUSED": "not used by any reaction"}
+
+    assert pruned["states"] == ["S_START", "S_A", "S_B", "S_EXIT"]
+    assert pruned["events"] == ["E_GO", "E_BACK", "E_STOP"]
+    assert pruned["transitions"] == ["T_START_A", "T_A_B", "T_B_A", "T_B_EXIT"]
+    assert pruned["reactions"] == ["R_GO", "R_A_B", "R_B_A", "R_B_EXIT"]
+    assert pruned["start_state"] == 0 and pruned["end_state"] == 3
+    # indices are remapped to the kept elements
+    assert pruned["from_state"] == [0, 1, 2, 2]
+    assert pruned["to_state"] == [1, 2, 1, 3]
+    assert pruned["term_requires"] == [0b001, 0b001, 0b010, 0b100]
+
+
+def test_prune_keep_indices_only_removes_transitions_and_reactions(metamodel):
+    ir = _ir(metamodel, PRUNED)
+    pruned, report = prune_ir(ir, keep_indices=True)
+
+    assert not report.states and not report.events
+    assert pruned["states"] == ir["states"]
+    assert pruned["events"] == ir["events"]
+    assert pruned["start_state"] == ir["start_state"]
+    assert pruned["end_state"] == ir["end_state"]
+    assert set(pruned["reactions"]) == set(ir["reactions"]) - set(report.reactions)
+
+
+@pytest.mark.parametrize("source", [PRUNED, EXAMPLE], ids=["pruned", "example"])
+@pytest.mark.parametrize("seed", range(5))
+def test_prune_keeps_behaviour(metamodel, source, seed):
+    ir = _ir(metamodel, source)
+    pruned, _ = prune_ir(ir)
+    steps = _random_steps(ir, seed)
+
+    expected = [(ir["states"][state], fired) for state, fired in _trace(ir, steps)]
+    actual = [(pruned["states"][state], fired) for state, fired in _trace(pruned, steps)]
+    assert actual == expected
+
+
+def test_minimize_merges_equivalent_states(metamodel):
+    ir = _ir(metamodel, MIRRORED)
+    minimized = minimize_ir(ir)
+
+    assert minimized["states"] == ["S_START", "S_LEFT", "S_LEFT_DONE", "S_EXIT"]
+    assert minimized["original_states"] == ir["states"]
+    assert minimized["state_map"] == [0, 1, 1, 2, 2, 3]
+    assert minimized["transitions"] == [
+        "T_START_LEFT",
+        "T_START_RIGHT",
+        "T_LEFT_DONE",
+        "T_LEFT_EXIT",
+    ]
+    assert minimized["to_state"] == [1, 1, 2, 3]
+    assert minimized["start_state"] == 0 and minimized["end_state"] == 3
+
+
+def test_minimize_keeps_distinct_states(metamodel):
+    ir = _ir(metamodel, EXAMPLE)
+    minimized = minimize_ir(ir)
+
+    assert minimized["states"] == ir["states"]
+    assert minimized["state_map"] == list(range(len(ir["states"])))
+
+
+@pytest.mark.parametrize("source", [MIRRORED, EXAMPLE], ids=["mirrored", "example"])
+@pytest.mark.parametrize("seed", range(5))
+def test_minimize_keeps_behaviour(metamodel, source, seed):
+    ir = _ir(metamodel, source)
+    minimized = minimize_ir(ir)
+    steps = _random_steps(ir, seed)
+
+    expected = [(minimized["state_map"][state], fired) for state, fired in _trace(ir, steps)]
+    assert _trace(minimized, steps) == expected
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MPL-2.0
+from pathlib import Path
+
+import pytest
+from textx.exceptions import TextXError
+
+from coord_dsl.generators.registration import fsm_metamodel
+from coord_dsl.generators.validation import IncrementalValidator, validate_fsm
+
+EXAMPLE = (Path(__file__).parents[1] / "examples/models/fsm/example.fsm").read_text()
+EXAMPLE_LINES = EXAMPLE.split("\n")
+
+
+@pytest.fixture(scope="module")
+def metamodel():
+    return fsm_metamodel()
+
+
+def _full(metamodel, source: str) -> list[tuple]:
+    try:
+        model = metamodel.model_from_str(source)
+    except TextXError as e:
+        return [(e.line or 1, e.col or 1, e.message, "error")]
+    return [(d.line, d.column, d.message, d.severity) for d in validate_fsm(model.fsm)]
+
+
+def _edits() -> list:
+    """Models with one line of the example deleted or missing its last character"""
+    edits = []
+    for index, line in enumerate(EXAMPLE_LINES):
+        if not line.strip():
+            continue
+        edits.append(
+            pytest.param(
+                "\n".join(EXAMPLE_LINES[:index] + EXAMPLE_LINES[index + 1 :]),
+                id=f"del{index + 1}",
+            )
+        )
+        edits.append(
+            pytest.param(
+                "\n".join(EXAMPLE_LINES[:index] + [line[:-1]] + EXAMPLE_LINES[index + 1 :]),
+                id=f"trunc{index + 1}",
+            )
+        )
+    return edits
+
+
+@pytest.mark.parametrize("source", _edits())
+def test_incremental_matches_full_validation(metamodel, source):
+    validator = IncrementalValidator(metamodel)
+    validator.update(EXAMPLE)
+    incremental = [(d.line, d.column, d.message, d.severity) for d in validator.update(source)]
+    full = _full(metamodel, source)
+
+    # the full parse stops at the first unknown reference or duplicate name, while the
+    # incremental validator reports all of them, with messages of its own for duplicates
+    if full and full[0][2].startswith("Unknown object"):
+        assert full[0] in incremental
+    elif full and full[0][2].startswith("Duplicate"):
+        assert full[0][:2] in [diagnostic[:2] for diagnostic in incremental]
+    else:
+        assert incremental == full
+
+    # the result does not depend on the previous text
+    fresh = IncrementalValidator(metamodel).update(source)
+    assert [(d.line, d.column, d.message, d.severity) for d in fresh] == incremental
+
+
+def test_entry_ending_early_is_reported_at_the_next_entry(metamodel):
+    index = next(i for i, line in enumerate(EXAMPLE_LINES) if line.strip().startswith("DO:"))
+    source = "\n".join(EXAMPLE_LINES[:index] + EXAMPLE_LINES[index + 1 :])
+    validator = IncrementalValidator(metamodel)
+    validator.update(EXAMPLE)
+    diagnostics = validator.update(source)
+    assert [(d.line, d.column, d.message) for d in diagnostics] == [
+        (line, column, message) for line, column, message, _ in _full(metamodel, source)
+    ]
+    assert len(diagnostics) == 1 and diagnostics[0].line == index + 1
+
+
+def test_unchanged_model_keeps_its_diagnostics(metamodel):
+    validator = IncrementalValidator(metamodel)
+    first = validator.update(EXAMPLE)
+    assert validator.update(EXAMPLE) == first
+    assert [(d.line, d.column, d.message, d.severity) for d in first] == _full(metamodel, EXAMPLE)